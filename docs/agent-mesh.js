@@ -1674,6 +1674,8 @@
 
   const relayConnections = new Map() // Map<relayId, {ws, connected, heartbeat, reconnectTimer}>
   const relayReconnectProviders = new Map() // Map<relayId, reconnectFn>
+  const relayRedirectHops = new Map() // Map<relayId, redirects followed since the last accepted connection>
+  const MAX_RELAY_REDIRECTS = 3
   const relayInstanceId = localStorage.getItem('mesh_instance_id') || (() => {
     const id = `agi-${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 6)}`
     localStorage.setItem('mesh_instance_id', id)
@@ -1734,13 +1736,21 @@
         const handler = subscribers.get('relay-status')
         if (handler) handler({ connected: false, url, relayId })
 
-        // Auto-reconnect with exponential backoff (30s to 5min)
-        const provider = relayReconnectProviders.get(relayId)
+        // An overloaded relay pointed us at a sibling; go there now instead of backing off
+        const redirect = conn.redirect
+        conn.redirect = null
+        if (redirect && followRelayRedirect(relayId, redirect)) return
+
+        // Auto-reconnect with exponential backoff (30s to 5min), or at the
+        // relay's randomized hint when it closed us for a restart/drain
+        const hint = conn.reconnectHintMs
+        conn.reconnectHintMs = null
+        const provider = relayReconnectProviders.get(relayId) || (hint != null ? () => connectRelay(url, relayId) : null)
         if (provider && !conn.reconnectTimer) {
           conn.reconnectAttempts++
           const baseDelay = Math.min(30000 * Math.pow(2, conn.reconnectAttempts - 1), 300000) // 30s to 5min
           const jitter = (Math.random() - 0.5) * 10000 // +/- 5s
-          const delay = Math.max(1000, baseDelay + jitter)
+          const delay = hint != null ? hint : Math.max(1000, baseDelay + jitter)
 
           conn.reconnectTimer = setTimeout(async () => {
             conn.reconnectTimer = null
@@ -1755,6 +1765,25 @@
     } catch (err) { logRelay('error', relayId, 'Failed to connect', err.message) }
   }
 
+  function followRelayRedirect (relayId, target) {
+    const hops = (relayRedirectHops.get(relayId) || 0) + 1
+    if (hops > MAX_RELAY_REDIRECTS) {
+      logRelay('warn', relayId, 'Too many redirects', `${hops - 1} in a row; backing off`)
+      relayRedirectHops.delete(relayId)
+      return false
+    }
+    relayRedirectHops.set(relayId, hops)
+    if (target.arn) {
+      // Needs a freshly signed URL; delegate to agentcore-relay.js plugin
+      if (!window.AgentMesh.followAgentCoreRedirect) return false
+      window.AgentMesh.followAgentCoreRedirect(relayId, target)
+      return true
+    }
+    if (!target.url) return false
+    connectRelay(target.url, relayId)
+    return true
+  }
+
   function disconnectRelayById (relayId) {
     const conn = relayConnections.get(relayId)
     if (!conn) return
@@ -1790,6 +1819,7 @@
     sendRelay({
       type: 'presence',
       from: relayInstanceId,
+      features: ['presence_batch', 'batch', 'ping'],
       data: {
         status: 'online',
         agents: [...registeredAgents.keys()],
@@ -1802,18 +1832,54 @@
   function handleRelayMessage (msg, relayId) {
     const { type, from, data } = msg
 
+    if (type === 'reconnect') {
+      // Relay is draining; its close follows shortly
+      const conn = relayConnections.get(relayId)
+      if (conn) conn.reconnectHintMs = data?.delayMs ?? 0
+      logRelay('info', relayId, 'Relay requested reconnect', `${data?.reason || 'restart'} in ${data?.delayMs ?? 0}ms`)
+      return
+    }
+
+    if (type === 'redirect') {
+      // Relay is over its load watermark; its close follows immediately
+      const conn = relayConnections.get(relayId)
+      if (conn) conn.redirect = data
+      logRelay('info', relayId, 'Relay redirected us', `${data?.reason || 'overloaded'} → ${data?.url || data?.arn}`)
+      return
+    }
+
     if (type === 'capabilities_response') {
       // Store relay capabilities with AgentCards
       const conn = relayConnections.get(relayId)
       if (conn) {
         conn.agentCards = data.agentCards || []
         conn.activeAgents = data.activeAgents || []
+        conn.load = data.load || null
+        relayRedirectHops.delete(relayId) // accepted here
         logRelay('info', relayId, 'Capabilities', `${data.agentCards?.length || 0} agent types available`)
-        broadcast('relay-capabilities', { relayId, agentCards: data.agentCards, activeAgents: data.activeAgents })
+        broadcast('relay-capabilities', { relayId, agentCards: data.agentCards, activeAgents: data.activeAgents, load: data.load })
       }
       return
     }
 
+    if (type === 'ping') {
+      // Relay RTT probe; echo it back untouched
+      sendRelay({ type: 'pong', data }, relayId)
+      return
+    }
+
+    if (type === 'batch') {
+      // Frames the relay gathered in one tick, in send order
+      for (const frame of data?.frames || []) handleRelayMessage(frame, relayId)
+      return
+    }
+
+    if (type === 'presence_batch') {
+      // Coalesced joins/leaves from the relay, one presence frame per peer
+      for (const peer of data?.peers || []) handleRelayMessage(peer, relayId)
+      return
+    }
+
     if (type === 'presence' || type === 'heartbeat') {
       remotePeers.set(from, { agents: data?.agents || [], hostname: data?.hostname, lastSeen: Date.now(), relayId })
       // Register remote agents
@@ -13,6 +13,8 @@
 
     // Runtime credential cache (NOT persisted to localStorage)
     const credentialCache = new Map(); // Map<relayId, {accessKeyId, secretAccessKey, sessionToken, expiration}>
+    // Sibling runtimes an overloaded relay redirected us to; reconnects go there too
+    const redirectTargets = new Map(); // Map<relayId, {arn, region}>
 
     // ═══ Load AWS SDK v3 SignatureV4 ═══
     let SignatureV4, Sha256;
@@ -146,11 +148,24 @@
             credentialCache.set(relayId, credentials);
         }
         
-        const url = await presignUrl(credentials.accessKeyId, credentials.secretAccessKey, credentials.sessionToken, relay.region, relay.arn);
+        const target = redirectTargets.get(relayId);
+        const arn = target?.arn || relay.arn;
+        const region = target?.region || relay.region;
+        const url = await presignUrl(credentials.accessKeyId, credentials.secretAccessKey, credentials.sessionToken, region, arn);
         M.connectRelay(url, relayId);
         return true;
     }
 
+    // ═══ Follow a redirect to a sibling runtime ═══
+    async function followRedirect(relayId, target) {
+        redirectTargets.set(relayId, target);
+        logRelay('info', relayId, 'Following redirect', target.arn);
+        M.setRelayReconnectProvider(relayId, () => renewAndConnect(relayId));
+        if (!await renewAndConnect(relayId)) {
+            logRelay('warn', relayId, 'Redirect failed', target.arn);
+        }
+    }
+
     // ═══ Public API — extends AgentMesh ═══
     async function connectAgentCoreRelayById(relayId) {
         const config = M.getRelayConfig();
@@ -170,6 +185,7 @@
             credentialCache.set(relayId, credentials);
         }
         
+        redirectTargets.delete(relayId);
         M.setRelayReconnectProvider(relayId, () => renewAndConnect(relayId));
         const url = await presignUrl(credentials.accessKeyId, credentials.secretAccessKey, credentials.sessionToken, relay.region, relay.arn);
         M.connectRelay(url, relayId);
@@ -193,11 +209,13 @@
     // Attach to AgentMesh
     M.connectAgentCoreRelay = connectAgentCoreRelay; // Legacy
     M.connectAgentCoreRelayById = connectAgentCoreRelayById;
+    M.followAgentCoreRedirect = followRedirect;
     M.presignAgentCoreUrl = presignUrl;
     M.getAgentCoreConfig = getConfig;
     M.clearAgentCoreConfig = () => { 
         clearConfig(); 
         credentialCache.clear();
+        redirectTargets.clear();
     };
 
     // ═══ Amplify SDK Session Management ═══
@@ -105,13 +105,14 @@ export const EventSchemas = {
   'task-created': {
     description: 'A new task has been created',
     required: ['id', 'title', 'createdBy', 'timestamp'],
-    optional: ['description', 'parentId', 'assignedTo'],
+    optional: ['description', 'parentId', 'assignedTo', 'agent'],
     types: {
       id: 'string',
       title: 'string',
       description: 'string',
       parentId: 'string',
       assignedTo: 'string',
+      agent: 'string',
       createdBy: 'string',
       timestamp: 'number'
     }
@@ -132,12 +133,13 @@ export const EventSchemas = {
   'task-status-changed': {
     description: 'A task has transitioned to a new status',
     required: ['id', 'status', 'changedBy'],
-    optional: ['previousStatus', 'reason'],
+    optional: ['previousStatus', 'reason', 'assignedTo'],
     types: {
       id: 'string',
       status: ['pending', 'in-progress', 'blocked', 'complete', 'failed'],
       previousStatus: ['pending', 'in-progress', 'blocked', 'complete', 'failed'],
       reason: 'string',
+      assignedTo: 'string',
       changedBy: 'string'
     }
   },
@@ -291,12 +293,13 @@ export const EventSchemas = {
   'relay-capabilities': {
     description: 'Relay server announcing available agents and tools',
     required: ['relayId'],
-    optional: ['agentCards', 'activeAgents', 'tools'],
+    optional: ['agentCards', 'activeAgents', 'tools', 'load'],
     types: {
       relayId: 'string',
       agentCards: 'array',
       activeAgents: 'array',
-      tools: 'array'
+      tools: 'array',
+      load: 'object'
     }
   },
 
@@ -305,7 +308,7 @@ export const EventSchemas = {
     required: ['status'],
     optional: ['agents', 'hostname', 'pageId'],
     types: {
-      status: ['online', 'offline'],
+      status: ['online', 'offline', 'idle', 'stopped'],
       agents: 'array',
       hostname: 'string',
       pageId: 'string'
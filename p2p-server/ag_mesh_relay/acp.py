@@ -0,0 +1,215 @@
+"""
+Minimal ACP (Agent Client Protocol) client over each managed agent's stdio.
+
+The relay speaks JSON-RPC 2.0, one message per line, on kiro-cli's stdin
+and reads its stdout. Requests the relay sends carry ids of the form
+`relay-<n>`, so they cannot collide with requests peers pass through with
+`agent_command`. The first request on a channel is preceded by
+`initialize`; requests sent meanwhile wait for it. Each reply is handed to
+handlers[method](agent_id, context, result, error) with the context the
+request was sent with. Notifications and replies to peers' own requests
+are dropped.
+
+Requests from the agent are answered so it never waits on the relay:
+permission requests as cancelled, anything else as method not found.
+
+Channel state is plain data, so a restart hands in-flight requests to the
+successor relay, which reads the same pipes.
+"""
+
+import asyncio
+import json
+import os
+import threading
+from typing import Awaitable, Callable, Dict, Optional
+
+from . import log
+
+PROTOCOL_VERSION = 1
+# Bytes read from an agent's stdout at a time
+READ_SIZE = 65536
+# JSON-RPC error code for requests the relay does not implement
+METHOD_NOT_FOUND = -32601
+CLIENT_CAPABILITIES = {"fs": {"readTextFile": False, "writeTextFile": False}, "terminal": False}
+
+# agent_id -> {proc, next, pending: {request id: {method, context}}, ready, waiting: [request], buffer}
+channels: Dict[str, dict] = {}
+# request method -> async handler(agent_id, context, result, error) for its reply
+handlers: Dict[str, Callable[[str, dict, Optional[dict], Optional[dict]], Awaitable[None]]] = {}
+
+
+def attach(agent_id: str, proc) -> dict:
+    """The channel to proc, opened (and the old one dropped) when the agent's process changed."""
+    channel = channels.get(agent_id)
+    if channel is not None and channel["proc"] is proc:
+        return channel
+    detach(agent_id)
+    channel = {"proc": proc, "next": 0, "pending": {}, "ready": False, "waiting": [], "buffer": b""}
+    channels[agent_id] = channel
+    _listen(agent_id, channel)
+    return channel
+
+
+def detach(agent_id: str):
+    """Stop reading an agent; requests still waiting for a reply are forgotten."""
+    channel = channels.pop(agent_id, None)
+    if channel is not None:
+        _unlisten(channel)
+
+
+def request(agent_id: str, proc, method: str, params: dict, context: dict):
+    """Send a request; its reply goes to handlers[method]."""
+    channel = attach(agent_id, proc)
+    if method != "initialize" and not channel["ready"]:
+        channel["waiting"].append({"method": method, "params": params, "context": context})
+        if not any(p["method"] == "initialize" for p in channel["pending"].values()):
+            request(agent_id, proc, "initialize",
+                    {"protocolVersion": PROTOCOL_VERSION, "clientCapabilities": CLIENT_CAPABILITIES}, {})
+        return
+    channel["next"] += 1
+    request_id = f"relay-{channel['next']}"
+    channel["pending"][request_id] = {"method": method, "context": context}
+    error = _write(channel, {"jsonrpc": "2.0", "id": request_id, "method": method, "params": params})
+    if error:
+        _dispatch(agent_id, channel, {"id": request_id, "error": {"message": error}})
+
+
+def notify(agent_id: str, method: str, params: dict):
+    """Send a notification on an open channel (no-op when the agent has none)."""
+    channel = channels.get(agent_id)
+    if channel is not None:
+        _write(channel, {"jsonrpc": "2.0", "method": method, "params": params})
+
+
+def _write(channel: dict, message: dict) -> Optional[str]:
+    try:
+        channel["proc"].stdin.write(json.dumps(message) + "\n")
+        channel["proc"].stdin.flush()
+        return None
+    except (OSError, ValueError, AttributeError) as e:
+        return f"Could not write to agent: {e}"
+
+
+def _reply(agent_id: str, method: str, context: dict, result: Optional[dict], error: Optional[dict]):
+    handler = handlers.get(method)
+    if handler is not None:
+        asyncio.ensure_future(handler(agent_id, context, result, error))
+
+
+def _listen(agent_id: str, channel: dict):
+    fd = channel["proc"].stdout.fileno()
+    loop = asyncio.get_running_loop()
+    try:
+        loop.add_reader(fd, _readable, agent_id, channel, fd)
+        channel["reader"] = fd
+    except NotImplementedError:
+        # No add_reader (Windows proactor loop): block in a thread instead
+        threading.Thread(target=_read_blocking, args=(loop, agent_id, channel, fd), daemon=True).start()
+
+
+def _unlisten(channel: dict):
+    fd = channel.pop("reader", None)
+    if fd is not None:
+        asyncio.get_running_loop().remove_reader(fd)
+
+
+def _read_blocking(loop, agent_id: str, channel: dict, fd: int):
+    while True:
+        try:
+            data = os.read(fd, READ_SIZE)
+        except OSError:
+            data = b""
+        loop.call_soon_threadsafe(_received, agent_id, channel, data)
+        if not data:
+            return
+
+
+def _readable(agent_id: str, channel: dict, fd: int):
+    try:
+        data = os.read(fd, READ_SIZE)
+    except OSError:
+        data = b""
+    _received(agent_id, channel, data)
+
+
+def _received(agent_id: str, channel: dict, data: bytes):
+    if channels.get(agent_id) is not channel:
+        return
+    if not data:
+        # The agent closed stdout, so it is exiting; the reaper settles its tasks
+        detach(agent_id)
+        return
+    *lines, channel["buffer"] = (channel["buffer"] + data).split(b"\n")
+    for line in lines:
+        try:
+            message = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(message, dict):
+            _dispatch(agent_id, channel, message)
+
+
+def _dispatch(agent_id: str, channel: dict, message: dict):
+    if "method" in message:
+        if "id" in message:
+            if message["method"] == "session/request_permission":
+                answer = {"result": {"outcome": {"outcome": "cancelled"}}}
+            else:
+                answer = {"error": {"code": METHOD_NOT_FOUND, "message": f"{message['method']} is not supported"}}
+            _write(channel, {"jsonrpc": "2.0", "id": message["id"], **answer})
+        return
+    pending = channel["pending"].pop(message.get("id"), None) if isinstance(message.get("id"), str) else None
+    if pending is None:
+        return
+    error = message.get("error") if isinstance(message.get("error"), dict) else None
+    if pending["method"] == "initialize":
+        waiting, channel["waiting"] = channel["waiting"], []
+        if error:
+            log.warn("agents", f"Agent {agent_id} refused ACP initialize: {error.get('message')}")
+            for queued in waiting:
+                _reply(agent_id, queued["method"], queued["context"], None, error)
+            return
+        channel["ready"] = True
+        for queued in waiting:
+            request(agent_id, channel["proc"], queued["method"], queued["params"], queued["context"])
+        return
+    _reply(agent_id, pending["method"], pending["context"], message.get("result"), error)
+
+
+def pause():
+    """Stop reading every agent, keeping channel state (a successor is taking over)."""
+    for channel in channels.values():
+        _unlisten(channel)
+
+
+def resume():
+    """Read every agent again after pause()."""
+    for agent_id, channel in channels.items():
+        if "reader" not in channel:
+            _listen(agent_id, channel)
+
+
+def snapshot() -> Dict[str, dict]:
+    """Serializable channel state, for handing over to a successor relay."""
+    return {
+        agent_id: {
+            "next": channel["next"], "pending": channel["pending"], "ready": channel["ready"],
+            "waiting": channel["waiting"], "buffer": channel["buffer"].decode("latin-1"),
+        }
+        for agent_id, channel in channels.items()
+    }
+
+
+def restore(saved: Dict[str, dict], processes: Dict[str, object]):
+    """Resume the channels handed over by a predecessor relay on the adopted processes."""
+    for agent_id, state in saved.items():
+        proc = processes.get(agent_id)
+        if proc is None or proc.stdout is None:
+            continue
+        channel = attach(agent_id, proc)
+        channel.update({**state, "buffer": state["buffer"].encode("latin-1")})
+
+
+def clear():
+    for agent_id in list(channels):
+        detach(agent_id)
@@ -0,0 +1,74 @@
+"""
+Connection admission control for the local relay.
+
+Applied as the websockets process_request hook, before the handshake
+completes: a token bucket caps the accept rate and a bounded count of
+in-flight handshakes caps concurrency. Rejected clients get HTTP 503 with
+a randomized Retry-After so a reconnect storm spreads itself out.
+"""
+
+import os
+import random
+import time
+from collections import deque
+from http import HTTPStatus
+from typing import Optional
+
+# New connections per second, and how many may arrive at once
+ACCEPT_RATE = float(os.getenv("ACCEPT_RATE", "50"))
+ACCEPT_BURST = int(os.getenv("ACCEPT_BURST", "100"))
+# Handshakes admitted but not yet handed to the connection handler
+MAX_HANDSHAKES = int(os.getenv("MAX_HANDSHAKES", "64"))
+# Admitted handshakes that never reach the handler are forgotten after this
+HANDSHAKE_TIMEOUT = 10
+RETRY_AFTER_MAX = 10
+
+_bucket = {"tokens": float(ACCEPT_BURST), "updated": time.monotonic()}
+# admission times of handshakes in flight, oldest first
+_handshakes: deque = deque()
+stats = {"admitted": 0, "rejected": 0}
+
+
+def admit() -> Optional[str]:
+    """Admit one connection attempt. Returns a reason when it is rejected."""
+    now = time.monotonic()
+    while _handshakes and now - _handshakes[0] > HANDSHAKE_TIMEOUT:
+        _handshakes.popleft()
+
+    tokens = min(ACCEPT_BURST, _bucket["tokens"] + (now - _bucket["updated"]) * ACCEPT_RATE)
+    _bucket["updated"] = now
+
+    if len(_handshakes) >= MAX_HANDSHAKES:
+        reason = "Too many concurrent handshakes"
+    elif tokens < 1:
+        reason = "Accept rate exceeded"
+    else:
+        _bucket["tokens"] = tokens - 1
+        _handshakes.append(now)
+        stats["admitted"] += 1
+        return None
+
+    _bucket["tokens"] = tokens
+    stats["rejected"] += 1
+    return reason
+
+
+def handshake_done():
+    """Release one in-flight handshake slot once the handler is running."""
+    if _handshakes:
+        _handshakes.popleft()
+
+
+def process_request(*args):
+    """websockets process_request hook; supports both the new and legacy APIs."""
+    reason = admit()
+    if reason is None:
+        return None
+    retry_after = str(random.randint(1, RETRY_AFTER_MAX))
+    if hasattr(args[0], "respond"):
+        # websockets >= 14: (connection, request)
+        response = args[0].respond(HTTPStatus.SERVICE_UNAVAILABLE, reason + "\n")
+        response.headers["Retry-After"] = retry_after
+        return response
+    # legacy: (path, request_headers)
+    return HTTPStatus.SERVICE_UNAVAILABLE, [("Retry-After", retry_after)], (reason + "\n").encode()
@@ -0,0 +1,180 @@
+"""Benchmark the relay core through each transport adapter and check parity.
+
+    python -m ag_mesh_relay.bench --peers 200 --messages 20 [--batch] [--envelope]
+
+Drives core.serve() with in-memory sockets shaped like the websockets library
+(local relay) and like Starlette (AgentCore relay), runs the same seeded
+workload of presence, broadcast and direct traffic through both, and reports
+throughput per adapter. Deliveries are fingerprinted per peer; any difference
+between adapters is reported and fails the run.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import Counter
+from typing import Dict, List
+
+from . import core
+from .replay import fingerprint, unbatch
+
+
+class FakeWebsocket:
+    """In-memory socket with the websockets library's interface."""
+
+    def __init__(self):
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        self.sent: List[str] = []
+
+    async def send(self, raw: str):
+        self.sent.append(raw)
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        self.inbox.put_nowait(None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        raw = await self.inbox.get()
+        if raw is None:
+            raise StopAsyncIteration
+        return raw
+
+
+class FakeStarlette(FakeWebsocket):
+    """In-memory socket with Starlette's WebSocket interface."""
+
+    async def send_text(self, raw: str):
+        self.sent.append(raw)
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        self.inbox.put_nowait(None)
+
+    async def receive_text(self) -> str:
+        raw = await self.inbox.get()
+        if raw is None:
+            raise core.WebSocketDisconnect()
+        return raw
+
+
+ADAPTERS = {
+    "websockets": (core.WebsocketsConnection, FakeWebsocket),
+    "starlette": (core.StarletteConnection, FakeStarlette),
+}
+
+
+def workload(peers: int, messages: int, direct_ratio: float, seed: int) -> List[tuple]:
+    """(sender index, frame) pairs for the traffic phase."""
+    rng = random.Random(seed)
+    frames = []
+    for n in range(messages):
+        for i in range(peers):
+            if rng.random() < direct_ratio:
+                to = rng.randrange(peers)
+                frames.append((i, json.dumps({"type": "direct", "from": f"peer-{i}", "to": f"peer-{to}",
+                                              "data": {"n": n}})))
+            else:
+                frames.append((i, json.dumps({"type": "stream", "from": f"peer-{i}",
+                                              "data": {"n": n, "text": "x" * rng.randrange(16, 256)}})))
+    return frames
+
+
+async def _settle(sockets: List[FakeWebsocket]):
+    """Wait until every inbound frame is processed and presence is flushed."""
+    while any(not s.inbox.empty() for s in sockets) or core.relay_state["presence_flush"] is not None:
+        await asyncio.sleep(0.001)
+    await asyncio.sleep(0.01)
+
+
+async def run_adapter(name: str, peers: int, frames: List[tuple], features: List[str]) -> dict:
+    """Run the workload through one adapter against a fresh core."""
+    conn_cls, sock_cls = ADAPTERS[name]
+    core.reset()
+    sockets = [sock_cls() for _ in range(peers)]
+    tasks = [asyncio.ensure_future(core.serve(conn_cls(s))) for s in sockets]
+
+    start = time.perf_counter()
+    for i, s in enumerate(sockets):
+        presence = {"type": "presence", "from": f"peer-{i}", "data": {"status": "online", "agents": []}}
+        if features:
+            presence["features"] = features
+        s.inbox.put_nowait(json.dumps(presence))
+    await asyncio.sleep(core.PRESENCE_COALESCE_WINDOW)
+    await _settle(sockets)
+    joined = time.perf_counter()
+
+    for i, raw in frames:
+        sockets[i].inbox.put_nowait(raw)
+    await _settle(sockets)
+    done = time.perf_counter()
+
+    for s in sockets:
+        s.inbox.put_nowait(None)
+    await asyncio.gather(*tasks)
+    core.reset()
+
+    delivered = sum(len(s.sent) for s in sockets)
+    return {
+        "adapter": name,
+        "joinSeconds": round(joined - start, 4),
+        "trafficSeconds": round(done - joined, 4),
+        "framesIn": len(frames),
+        "framesOut": delivered,
+        "framesInPerSec": round(len(frames) / (done - joined)) if done > joined else None,
+        "deliveries": {
+            f"peer-{i}": Counter(fingerprint(item) for raw in s.sent for item in unbatch(raw))
+            for i, s in enumerate(sockets)
+        }
+    }
+
+
+def parity(results: List[dict]) -> Dict[str, int]:
+    """Peers whose deliveries differ from the first adapter's, with the count of differing frames."""
+    base = results[0]["deliveries"]
+    diffs = {}
+    for result in results[1:]:
+        for peer, counts in result["deliveries"].items():
+            diff = sum(((base[peer] - counts) + (counts - base[peer])).values())
+            if diff:
+                diffs[f"{result['adapter']}:{peer}"] = diff
+    return diffs
+
+
+async def bench(peers: int, messages: int, direct_ratio: float, seed: int, features: List[str]) -> List[dict]:
+    frames = workload(peers, messages, direct_ratio, seed)
+    return [await run_adapter(name, peers, frames, features) for name in ADAPTERS]
+
+
+def main():
+    """CLI entry point."""
+    parser = argparse.ArgumentParser(description="Benchmark relay core adapters for throughput and parity")
+    parser.add_argument("--peers", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=20, help="messages sent by each peer")
+    parser.add_argument("--direct-ratio", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--batch", action="store_true", help="peers negotiate presence_batch")
+    parser.add_argument("--envelope", action="store_true", help="peers negotiate the batch envelope")
+    parser.add_argument("--validate", action="store_true", help="keep VALIDATE_EVENTS on")
+    args = parser.parse_args()
+
+    if not args.validate:
+        core.VALIDATE_EVENTS = False
+    features = ["presence_batch"] * args.batch + ["batch"] * args.envelope
+    results = asyncio.run(bench(args.peers, args.messages, args.direct_ratio, args.seed, features))
+    for r in results:
+        print(f"{r['adapter']:>10}: join {r['joinSeconds']}s, traffic {r['trafficSeconds']}s, "
+              f"{r['framesIn']} in / {r['framesOut']} out, {r['framesInPerSec']} frames/s")
+
+    diffs = parity(results)
+    if diffs:
+        print(f"Parity FAILED for {len(diffs)} peers: {dict(list(diffs.items())[:10])}")
+        sys.exit(1)
+    print("Parity OK: every peer received identical frames through both adapters")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Inverted index over AgentCards and live agent instances for `find_agents`.
+
+Cards are indexed by skill id, tag and input/output mode. Instances are the
+configured, launched and discovered agents known to the relay, each tied to
+the card of its runtime. A query intersects the index sets, so answering it
+costs the size of the matches, not of every card.
+
+Query:
+    {type: 'find_agents', requestId?, data: {tags?, skills?, inputModes?, outputModes?,
+                                             agent?, available?, limit?}}
+Response:
+    {type: 'find_agents_response', requestId, data: {cards: [{name, skills}], agents: [...]}}
+
+List criteria (a string or a list of strings) all have to match; a
+malformed query gets an `error` frame. Agents are ranked running, idle
+(suspended), discovered, stopped (hibernated, relaunched on the next
+command), exited, then configured but never launched; within a status those
+with the fewest dispatched tasks (`tasks`, running or queued), then the least
+recently commanded come first. `available` keeps the managed agents a
+command reaches: running, idle and stopped.
+"""
+
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+from .agent_cards import AGENT_CARDS
+
+# Instance statuses in ranking order
+STATUS_RANK = {"running": 0, "idle": 1, "discovered": 2, "stopped": 3, "exited": 4, "configured": 5}
+# Statuses of managed agents that accept agent_command (hibernated ones wake up)
+AVAILABLE_STATUSES = ("running", "idle", "stopped")
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+LIST_FIELDS = ("skills", "tags", "inputModes", "outputModes")
+
+# card name -> card
+cards: Dict[str, dict] = {}
+# field -> value -> card names
+index: Dict[str, Dict[str, Set[str]]] = {"skills": {}, "tags": {}, "inputModes": {}, "outputModes": {}}
+# instance id -> {id, card, agent, status, source, tasks, lastCommand}
+instances: Dict[str, dict] = {}
+# card name -> instance ids
+instances_by_card: Dict[str, Set[str]] = {}
+
+
+def register_card(card: dict):
+    """Add a card to the index."""
+    name = card["name"]
+    cards[name] = card
+    values = {
+        "skills": [skill["id"] for skill in card.get("skills", [])],
+        "tags": [tag for skill in card.get("skills", []) for tag in skill.get("tags", [])],
+        "inputModes": card.get("defaultInputModes", []),
+        "outputModes": card.get("defaultOutputModes", []),
+    }
+    for field, items in values.items():
+        for value in items:
+            index[field].setdefault(value, set()).add(name)
+
+
+def set_instance(instance_id: str, card: str, **fields):
+    """Create or update a live agent instance."""
+    instance = instances.setdefault(instance_id, {"id": instance_id, "card": card, "lastCommand": 0.0})
+    if instance["card"] != card:
+        instances_by_card.get(instance["card"], set()).discard(instance_id)
+        instance["card"] = card
+    instance.update(fields)
+    instances_by_card.setdefault(card, set()).add(instance_id)
+
+
+def remove_instance(instance_id: str):
+    instance = instances.pop(instance_id, None)
+    if instance:
+        instances_by_card.get(instance["card"], set()).discard(instance_id)
+
+
+def replace_discovered(discovered: Iterable[dict], card: str = "kiro-cli"):
+    """Swap in the latest set of externally discovered agents."""
+    for instance_id in [i for i, inst in instances.items() if inst.get("source") == "discovered"]:
+        remove_instance(instance_id)
+    for agent in discovered:
+        set_instance(agent["id"], card, agent=agent.get("agent"), status="discovered",
+                     source="discovered", cwd=agent.get("cwd"))
+
+
+def _as_list(value) -> List[str]:
+    if value is None:
+        return []
+    return [value] if isinstance(value, str) else list(value)
+
+
+def check_query(query) -> Optional[str]:
+    """Return an error if a find_agents query is malformed."""
+    if not isinstance(query, dict):
+        return "find_agents data must be an object"
+    for field in LIST_FIELDS:
+        value = query.get(field)
+        if value is None or isinstance(value, str):
+            continue
+        if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+            return f"{field} must be a string or a list of strings"
+    if query.get("agent") is not None and not isinstance(query["agent"], str):
+        return "agent must be a string"
+    limit = query.get("limit")
+    if limit is not None:
+        try:
+            int(limit)
+        except (TypeError, ValueError):
+            return "limit must be an integer"
+    return None
+
+
+def find(query: dict) -> dict:
+    """Answer a find_agents query that passed check_query()."""
+    criteria = {field: _as_list(query.get(field)) for field in index}
+    candidates: Optional[Set[str]] = None
+    for field, values in criteria.items():
+        for value in values:
+            names = index[field].get(value, set())
+            candidates = set(names) if candidates is None else candidates & names
+    if candidates is None:
+        candidates = set(cards)
+
+    wanted_skills = set(criteria["skills"])
+    wanted_tags = set(criteria["tags"])
+    matched_cards = []
+    for name in sorted(candidates):
+        skills = [
+            {"id": skill["id"], "name": skill["name"]}
+            for skill in cards[name].get("skills", [])
+            if skill["id"] in wanted_skills or wanted_tags.intersection(skill.get("tags", []))
+        ]
+        matched_cards.append({"name": name, "skills": skills})
+
+    now = time.time()
+    matched_agents = []
+    for name in candidates:
+        for instance_id in instances_by_card.get(name, ()):
+            instance = instances[instance_id]
+            if query.get("agent") and instance.get("agent") != query["agent"]:
+                continue
+            if query.get("available") and instance.get("status") not in AVAILABLE_STATUSES:
+                continue
+            matched_agents.append(instance)
+
+    if query.get("agent") or query.get("available"):
+        # Instance filters narrow the cards to the runtimes that have a match
+        with_agents = {inst["card"] for inst in matched_agents}
+        matched_cards = [card for card in matched_cards if card["name"] in with_agents]
+
+    matched_agents.sort(key=lambda inst: (
+        STATUS_RANK.get(inst.get("status"), len(STATUS_RANK)), inst.get("tasks", 0), inst.get("lastCommand", 0.0)
+    ))
+    limit = min(max(int(query.get("limit") or DEFAULT_LIMIT), 1), MAX_LIMIT)
+    agents = []
+    for instance in matched_agents[:limit]:
+        entry = {k: v for k, v in instance.items() if k != "lastCommand" and v is not None}
+        if instance.get("lastCommand"):
+            entry["idleSeconds"] = round(now - instance["lastCommand"], 1)
+        agents.append(entry)
+    return {"cards": matched_cards, "agents": agents}
+
+
+for _card in AGENT_CARDS:
+    register_card(_card)
@@ -0,0 +1,121 @@
+"""
+Opt-in capture of inbound relay traffic for replay.
+
+Enable with CAPTURE_FILE=/path/to/capture.jsonl.gz (gzip when the name ends in
+.gz). Set CAPTURE_REDACT=true to blank string payloads while keeping routing
+fields and frame sizes, so captures can be shared without message contents.
+
+File format, one JSON object per line:
+    {"version": 1, "started": <epoch>, "redacted": bool}      header
+    {"t": <seconds since start>, "c": <conn>, "k": "open"}
+    {"t": ..., "c": ..., "k": "msg", "p": <peer id or null>, "m": <raw frame>}
+    {"t": ..., "c": ..., "k": "close", "p": <peer id or null>}
+"""
+
+import gzip
+import itertools
+import json
+import os
+import time
+from typing import Iterator, Optional
+
+from . import log
+
+CAPTURE_FILE = os.getenv("CAPTURE_FILE")
+CAPTURE_REDACT = os.getenv("CAPTURE_REDACT", "false").lower() == "true"
+FLUSH_INTERVAL = 1.0
+
+# Fields kept verbatim under redaction because routing or validation depends on them
+REDACT_KEEP = {"type", "from", "to", "uploadId", "seq", "agentId", "status", "agent", "mimeType", "totalSize", "id"}
+
+_conn_ids = itertools.count(1)
+_state: dict = {"file": None, "started": 0.0, "redact": False, "flushed": 0.0}
+
+
+def start_capture(path: Optional[str] = CAPTURE_FILE, redact: bool = CAPTURE_REDACT) -> bool:
+    """Open the capture file. Returns False when capture is not configured."""
+    if not path:
+        return False
+    opener = gzip.open if path.endswith(".gz") else open
+    f = opener(path, "wt", encoding="utf-8")
+    now = time.time()
+    f.write(json.dumps({"version": 1, "started": now, "redacted": redact}) + "\n")
+    _state.update(file=f, started=now, redact=redact, flushed=now)
+    log.info("capture", f"Capturing inbound traffic to {path}{' (redacted)' if redact else ''}")
+    return True
+
+
+def stop_capture():
+    """Flush and close the capture file."""
+    f = _state["file"]
+    if f:
+        _state["file"] = None
+        f.close()
+
+
+def capturing() -> bool:
+    return _state["file"] is not None
+
+
+def new_connection() -> int:
+    """Allocate a connection id and record the open."""
+    conn = next(_conn_ids)
+    _write({"c": conn, "k": "open"})
+    return conn
+
+
+def record(conn: int, peer_id: Optional[str], raw):
+    """Record one inbound frame."""
+    if not _state["file"]:
+        return
+    if isinstance(raw, bytes):
+        raw = raw.decode("utf-8", "replace")
+    if _state["redact"]:
+        raw = redact_frame(raw)
+    _write({"c": conn, "k": "msg", "p": peer_id, "m": raw})
+
+
+def close_connection(conn: int, peer_id: Optional[str]):
+    _write({"c": conn, "k": "close", "p": peer_id})
+
+
+def redact_frame(raw: str) -> str:
+    """Replace payload strings with same-length filler, keeping routing fields."""
+    try:
+        return json.dumps(_redact(json.loads(raw)))
+    except ValueError:
+        return "*" * len(raw)
+
+
+def _redact(value, key: Optional[str] = None):
+    if key in REDACT_KEEP:
+        return value
+    if isinstance(value, dict):
+        return {k: _redact(v, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_redact(v) for v in value]
+    if isinstance(value, str):
+        return "*" * len(value)
+    return value
+
+
+def _write(entry: dict):
+    f = _state["file"]
+    if not f:
+        return
+    now = time.time()
+    entry["t"] = round(now - _state["started"], 6)
+    f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+    if now - _state["flushed"] > FLUSH_INTERVAL:
+        f.flush()
+        _state["flushed"] = now
+
+
+def load_capture(path: str) -> Iterator[dict]:
+    """Yield capture entries; the header is the first item."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
@@ -0,0 +1,166 @@
+"""
+Chunked transfer of large payloads through the relay.
+
+Large payloads (images, file contents) are split by the sender into a
+chunk_start / chunk / chunk_end sequence sharing an uploadId. The relay
+never reassembles them: each frame is forwarded to the recipients fixed at
+chunk_start as soon as it arrives, and the sender is paced with chunk_ack
+credits so at most CHUNK_WINDOW chunks per upload are in flight.
+
+Protocol:
+    {type: 'chunk_start', uploadId, to?, data: {mimeType, totalSize, messageType?}}
+    {type: 'chunk', uploadId, seq, data: '<base64>'}
+    {type: 'chunk_end', uploadId}
+
+    Relay -> sender:     {type: 'chunk_ack', uploadId, seq, window}
+    Relay -> anyone:     {type: 'chunk_abort', uploadId, data: {reason}}
+"""
+
+import time
+from typing import Dict, List, Optional, Tuple
+
+CHUNK_TYPES = ("chunk_start", "chunk", "chunk_end")
+
+# Hard cap on a single frame, enforced before JSON parsing; the websockets
+# default the relay accepted before chunking existed
+MAX_FRAME_SIZE = 1024 * 1024
+# Base64 payload of one chunk frame
+MAX_CHUNK_SIZE = 256 * 1024
+# Declared totalSize of an upload
+MAX_UPLOAD_SIZE = 32 * 1024 * 1024
+MAX_UPLOADS_PER_PEER = 4
+# Chunks a sender may have in flight before waiting for chunk_ack
+CHUNK_WINDOW = 8
+# Seconds without a chunk before an upload is aborted
+UPLOAD_IDLE_TIMEOUT = 30
+# Seconds a single recipient may take to accept a chunk before it is dropped
+CHUNK_SEND_TIMEOUT = 10
+
+# Per-type frame limits (characters of the raw frame)
+MAX_MESSAGE_SIZES = {
+    "presence": 16 * 1024,
+    "heartbeat": 1024,
+    "capabilities": 1024,
+    "get_schemas": 1024,
+    "launch_agent": 16 * 1024,
+    "stop_agent": 1024,
+    "chunk_start": 4 * 1024,
+    "chunk": MAX_CHUNK_SIZE + 1024,
+    "chunk_end": 1024,
+    # each frame inside is checked against its own type's limit
+    "batch": MAX_FRAME_SIZE,
+}
+# Routed types (broadcast, stream, direct, ...) keep the transport cap until
+# clients chunk their large payloads
+DEFAULT_MAX_MESSAGE_SIZE = MAX_FRAME_SIZE
+
+# upload_id -> {owner, recipients, total, received, seq, last_seen}
+uploads: Dict[str, dict] = {}
+
+
+def check_message_size(mtype: Optional[str], size: int) -> Optional[str]:
+    """Return an error if a frame of this type exceeds its size limit."""
+    limit = MAX_MESSAGE_SIZES.get(mtype, DEFAULT_MAX_MESSAGE_SIZE)
+    if size > limit:
+        hint = " (use chunk_start/chunk/chunk_end)" if mtype not in CHUNK_TYPES else ""
+        return f"Message type {mtype} is {size} bytes, limit {limit}{hint}"
+    return None
+
+
+def open_upload(msg: dict, owner: Optional[str], recipients: List[str]) -> Tuple[Optional[dict], Optional[str]]:
+    """Register a new upload from chunk_start. Returns (upload, error)."""
+    upload_id = msg.get("uploadId")
+    total = (msg.get("data") or {}).get("totalSize", 0)
+
+    if not owner:
+        return None, "Send presence before chunk_start"
+    if not isinstance(upload_id, str) or not upload_id:
+        return None, "chunk_start requires uploadId"
+    if upload_id in uploads:
+        return None, f"Upload {upload_id} already exists"
+    if not isinstance(total, int) or total <= 0 or total > MAX_UPLOAD_SIZE:
+        return None, f"totalSize must be between 1 and {MAX_UPLOAD_SIZE}"
+    if sum(1 for u in uploads.values() if u["owner"] == owner) >= MAX_UPLOADS_PER_PEER:
+        return None, f"Too many concurrent uploads (max {MAX_UPLOADS_PER_PEER})"
+    if not recipients:
+        return None, "No recipients for upload"
+
+    upload = {
+        "id": upload_id,
+        "owner": owner,
+        "recipients": list(recipients),
+        "total": total,
+        "received": 0,
+        "seq": 0,
+        "last_seen": time.time()
+    }
+    uploads[upload_id] = upload
+    return upload, None
+
+
+def accept_chunk(msg: dict, owner: Optional[str], size: int) -> Tuple[Optional[dict], Optional[str]]:
+    """Account for one chunk frame. Returns (upload, error); on error the upload is closed."""
+    upload = uploads.get(msg.get("uploadId"))
+    if not upload or upload["owner"] != owner:
+        return None, "Unknown upload"
+
+    if msg.get("seq") != upload["seq"]:
+        uploads.pop(upload["id"], None)
+        return upload, f"Expected seq {upload['seq']}, got {msg.get('seq')}"
+
+    upload["received"] += size
+    # base64 inflates by 4/3; allow framing slack on top
+    if upload["received"] > upload["total"] * 4 // 3 + MAX_MESSAGE_SIZES["chunk"]:
+        uploads.pop(upload["id"], None)
+        return upload, "Upload exceeded declared totalSize"
+
+    upload["seq"] += 1
+    upload["last_seen"] = time.time()
+    return upload, None
+
+
+def close_upload(upload_id: Optional[str], owner: Optional[str]) -> Optional[dict]:
+    """Finish an upload on chunk_end."""
+    upload = uploads.get(upload_id)
+    if not upload or upload["owner"] != owner:
+        return None
+    return uploads.pop(upload_id)
+
+
+def drop_recipient(upload: dict, peer_id: str):
+    """Stop forwarding an upload to a recipient that went away or stalled."""
+    if peer_id in upload["recipients"]:
+        upload["recipients"].remove(peer_id)
+
+
+def drop_peer_uploads(peer_id: str) -> List[dict]:
+    """Abort uploads owned by a disconnected peer and remove it as a recipient."""
+    aborted = []
+    for upload_id, upload in list(uploads.items()):
+        if upload["owner"] == peer_id:
+            aborted.append(uploads.pop(upload_id))
+        else:
+            drop_recipient(upload, peer_id)
+    return aborted
+
+
+def expire_uploads(now: Optional[float] = None) -> List[dict]:
+    """Abort uploads that have not seen a chunk within UPLOAD_IDLE_TIMEOUT."""
+    now = now or time.time()
+    expired = [uid for uid, u in uploads.items() if now - u["last_seen"] > UPLOAD_IDLE_TIMEOUT]
+    return [uploads.pop(uid) for uid in expired]
+
+
+def ack_frame(upload: dict) -> dict:
+    """Credit the sender for the chunks forwarded so far."""
+    return {
+        "type": "chunk_ack",
+        "uploadId": upload["id"],
+        "seq": upload["seq"] - 1,
+        "window": CHUNK_WINDOW
+    }
+
+
+def abort_frame(upload_id: str, reason: str) -> dict:
+    """Tell a sender or recipient that an upload was abandoned."""
+    return {"type": "chunk_abort", "uploadId": upload_id, "data": {"reason": reason}}
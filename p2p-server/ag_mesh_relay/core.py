@@ -0,0 +1,649 @@
+"""
+Transport-agnostic relay core shared by the local relay (server.py, websockets)
+and the AgentCore relay (relay.py, Starlette).
+
+The core owns the peer table, presence coalescing, broadcast/direct routing
+(with mailboxes for offline recipients), chunked uploads, the stale-peer
+reaper, overload redirects to sibling relays and sampled delivery tracing.
+Transports wrap each client socket in a Connection adapter and hand it to
+serve(); deployment-specific message types are added through the `handlers`
+registry, and `observers` see routed frames after they are broadcast.
+"""
+
+import asyncio
+import json
+import os
+import random
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from . import capture, load, log, mailbox, tracing
+from .chunking import (
+    CHUNK_SEND_TIMEOUT, CHUNK_TYPES, MAX_FRAME_SIZE, abort_frame, accept_chunk, ack_frame,
+    check_message_size, close_upload, drop_peer_uploads, drop_recipient, expire_uploads, open_upload,
+    uploads,
+)
+from .event_schemas import validate_event
+
+try:
+    from starlette.websockets import WebSocketDisconnect
+except ImportError:  # only the AgentCore relay runs on Starlette
+    class WebSocketDisconnect(Exception):
+        pass
+
+STALE_TIMEOUT = 30
+REAP_INTERVAL = 10
+# Seconds a fan-out send to one peer may block before that peer is skipped
+SEND_TIMEOUT = 10
+# Peers are told to reconnect after a random delay up to this many seconds
+DRAIN_RECONNECT_SPREAD = 5.0
+# Seconds between sending reconnect hints and closing connections
+DRAIN_GRACE = 1.0
+# Presence joins/leaves within this window go out as one update per peer
+PRESENCE_COALESCE_WINDOW = float(os.getenv("PRESENCE_COALESCE_WINDOW", "0.25"))
+VALIDATE_EVENTS = os.getenv("VALIDATE_EVENTS", "true").lower() == "true"
+# Batching peers get their gathered frames after this many seconds (0: end of the loop tick)
+BATCH_LATENCY = float(os.getenv("BATCH_LATENCY_MS", "0")) / 1000
+# A batch is written as soon as it holds this many bytes
+BATCH_MAX_BYTES = 64 * 1024
+
+
+class Connection:
+    """One client socket as seen by the core; subclasses adapt a transport.
+
+    Once a peer negotiates the `batch` feature, frames sent to it are
+    gathered for the rest of the event-loop tick (or BATCH_LATENCY) and
+    written as one {type: 'batch', data: {frames: [...]}} frame.
+    """
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.peer_id: Optional[str] = None
+        self.capture_id: Optional[int] = None
+        self.batching = False
+        self.outbox: List[str] = []
+        self.outbox_bytes = 0
+        # traces of sampled frames in the outbox, stamped written when it is flushed
+        self.outbox_traces: List[dict] = []
+        self.flush_pending = False
+        self.flush_lock = asyncio.Lock()
+        self.send_error: Optional[Exception] = None
+        # frames handed to the transport that it has not accepted yet
+        self.sending = 0
+
+    async def send_frame(self, raw: str):
+        """Write one frame to the transport."""
+        raise NotImplementedError
+
+    def buffered_bytes(self) -> int:
+        """Bytes the transport has accepted but not sent yet (0 when it can't tell)."""
+        return 0
+
+    async def close_transport(self, code: int, reason: str):
+        raise NotImplementedError
+
+    def frames(self):
+        """Async iterator over inbound text frames; ends when the peer hangs up."""
+        raise NotImplementedError
+
+    async def send(self, raw: str, trace: Optional[dict] = None):
+        """Send one frame; pass the trace of a sampled frame to stamp its per-peer hops."""
+        if trace is not None:
+            tracing.enqueued(trace, self.peer_id)
+        if not self.batching:
+            await self.write(raw)
+            if trace is not None:
+                tracing.written(trace, self.peer_id)
+            return
+        if self.send_error is not None:
+            raise self.send_error
+        self.outbox.append(raw)
+        self.outbox_bytes += len(raw)
+        if trace is not None:
+            self.outbox_traces.append(trace)
+        if self.outbox_bytes >= BATCH_MAX_BYTES:
+            # Full batch: write it now, which also pushes back on the sender like an unbatched send
+            await self.flush()
+        elif not self.flush_pending:
+            self.flush_pending = True
+            loop = asyncio.get_running_loop()
+            if BATCH_LATENCY:
+                loop.call_later(BATCH_LATENCY, lambda: asyncio.ensure_future(self.flush_later()))
+            else:
+                loop.call_soon(lambda: asyncio.ensure_future(self.flush_later()))
+
+    async def flush(self):
+        """Write everything gathered so far, as one batch frame if there is more than one."""
+        async with self.flush_lock:
+            self.flush_pending = False
+            if not self.outbox:
+                return
+            frames, self.outbox, self.outbox_bytes = self.outbox, [], 0
+            traces, self.outbox_traces = self.outbox_traces, []
+            if len(frames) == 1:
+                await self.write(frames[0])
+            else:
+                # The gathered frames are JSON already; splice rather than re-serialize
+                await self.write('{"type": "batch", "data": {"frames": [' + ", ".join(frames) + "]}}")
+            for trace in traces:
+                tracing.written(trace, self.peer_id)
+
+    async def write(self, raw: str):
+        """send_frame, counted as queued while the transport pushes back."""
+        self.sending += 1
+        try:
+            await self.send_frame(raw)
+        finally:
+            self.sending -= 1
+
+    async def flush_later(self):
+        try:
+            await self.flush()
+        except Exception as e:
+            # Nobody awaits this write; fail the next send so callers see the peer is gone
+            self.send_error = e
+            self.outbox, self.outbox_bytes, self.outbox_traces = [], 0, []
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        if self.outbox:
+            try:
+                await self.flush()
+            except Exception:
+                pass
+        await self.close_transport(code, reason)
+
+    async def send_json(self, msg: dict):
+        await self.send(json.dumps(msg))
+
+
+class WebsocketsConnection(Connection):
+    """Adapter for the `websockets` library (local relay)."""
+
+    async def send_frame(self, raw: str):
+        await self.ws.send(raw)
+
+    def buffered_bytes(self) -> int:
+        transport = getattr(self.ws, "transport", None)
+        return transport.get_write_buffer_size() if transport is not None else 0
+
+    async def close_transport(self, code: int, reason: str):
+        await self.ws.close(code, reason)
+
+    async def frames(self):
+        async for raw in self.ws:
+            yield raw
+
+
+class StarletteConnection(Connection):
+    """Adapter for Starlette WebSockets (AgentCore relay)."""
+
+    async def send_frame(self, raw: str):
+        await self.ws.send_text(raw)
+
+    async def close_transport(self, code: int, reason: str):
+        await self.ws.close(code=code, reason=reason)
+
+    async def frames(self):
+        while True:
+            try:
+                yield await self.ws.receive_text()
+            except WebSocketDisconnect:
+                return
+
+
+# peer_id -> {conn, last_seen, meta, features}; conn is None for peers
+# inherited from a predecessor relay that have not reconnected yet
+peers: Dict[str, dict] = {}
+# every open connection, identified or not
+connections: set = set()
+# draining flag, pending presence flush, reaper and RTT prober tasks
+relay_state: dict = {"draining": False, "presence_flush": None, "reaper": None, "prober": None}
+# peer_id -> latest presence frame waiting for the next coalesced flush
+pending_presence: Dict[str, dict] = {}
+# peers whose first presence on their connection arrived since the last flush
+pending_joins: set = set()
+# message type -> async handler(conn, msg) for deployment-specific requests
+handlers: Dict[str, Callable[[Connection, dict], Awaitable[None]]] = {}
+# message type -> async observer(conn, msg) run after a routed frame was broadcast
+observers: Dict[str, Callable[[Connection, dict], Awaitable[None]]] = {}
+# connection -> minimum level of relay-log events it subscribed to
+log_subscribers: Dict[Connection, int] = {}
+
+
+def reset():
+    """Forget all peers and pending work (used between benchmark runs)."""
+    peers.clear()
+    connections.clear()
+    pending_presence.clear()
+    pending_joins.clear()
+    uploads.clear()
+    mailbox.clear()
+    tracing.clear()
+    log_subscribers.clear()
+    if relay_state["presence_flush"] is not None:
+        relay_state["presence_flush"].cancel()
+    relay_state.update(draining=False, presence_flush=None)
+
+
+def check_event(msg: dict):
+    """Log events that don't match their schema when VALIDATE_EVENTS is on."""
+    if VALIDATE_EVENTS and "type" in msg:
+        is_valid, errors = validate_event(msg["type"], msg.get("data", {}))
+        if not is_valid:
+            # Repeats from one peer are aggregated by the log writer
+            log.warn("validation", f"Invalid event {msg['type']} from {msg.get('from', 'unknown')}", errors=errors)
+
+
+async def broadcast(msg: dict, *, exclude: Optional[str] = None, raw: Optional[str] = None,
+                    trace: Optional[dict] = None):
+    """Broadcast message to all connected peers except excluded one.
+
+    Pass the inbound frame as raw to forward it without re-serializing, and
+    its trace when it was sampled.
+    """
+    check_event(msg)
+    if trace is not None:
+        msg = tracing.stamp(msg, trace)
+        raw = None
+    if raw is None:
+        raw = json.dumps(msg)
+    gone = []
+    # Sends yield to the loop, so joins and leaves can change peers meanwhile
+    for pid, p in list(peers.items()):
+        if pid == exclude or p["conn"] is None:
+            continue
+        try:
+            await p["conn"].send(raw, trace)
+        except Exception:
+            gone.append(pid)
+    for pid in gone:
+        peers.pop(pid, None)
+
+
+async def send_direct(conn: Connection, msg: dict, raw: str, trace: Optional[dict] = None):
+    """Forward a direct message, holding it in the target's mailbox if it is not connected."""
+    target = msg.get("to")
+    if not target:
+        return
+    if trace is not None:
+        msg = tracing.stamp(msg, trace)
+        raw = json.dumps(msg)
+    p = peers.get(target)
+    if p and p["conn"] is not None:
+        try:
+            await p["conn"].send(raw, trace)
+            return
+        except Exception:
+            pass  # target is going away; hold the message for its reconnect
+
+    entry, evicted = mailbox.store(target, msg, raw, conn.peer_id)
+    for old in evicted:
+        await notify_sender(old, "dropped")
+    if entry is None:
+        entry = {"to": target, "turnId": msg.get("turnId"), "id": msg.get("id")}
+        await conn.send_json(mailbox.status_frame(entry, "dropped"))
+    else:
+        await conn.send_json(mailbox.status_frame(entry, "queued"))
+
+
+async def notify_sender(entry: dict, status: str):
+    """Report the fate of a held message to its sender, if still connected."""
+    p = peers.get(entry["sender"])
+    if p and p["conn"] is not None:
+        try:
+            await p["conn"].send_json(mailbox.status_frame(entry, status))
+        except Exception:
+            pass
+
+
+async def deliver_mail(conn: Connection, peer_id: str):
+    """Flush a reconnecting peer's mailbox in one burst and ack the senders."""
+    entries = mailbox.take(peer_id)
+    for entry in entries:
+        await conn.send(entry["raw"])
+    for entry in entries:
+        await notify_sender(entry, "delivered")
+
+
+def queue_presence(frame: dict, *, joined: bool = False):
+    """Queue a presence change; changes inside one window go out together.
+
+    Only the latest frame per peer is kept, and peers that joined during the
+    window get one directory snapshot instead of a dump per join.
+    """
+    pending_presence[frame["from"]] = frame
+    if joined:
+        pending_joins.add(frame["from"])
+    if relay_state["presence_flush"] is None:
+        relay_state["presence_flush"] = asyncio.get_running_loop().call_later(
+            PRESENCE_COALESCE_WINDOW, lambda: asyncio.ensure_future(flush_presence())
+        )
+
+
+async def flush_presence():
+    """Send the coalesced presence changes to every connected peer."""
+    relay_state["presence_flush"] = None
+    changes = list(pending_presence.values())
+    joins = set(pending_joins)
+    pending_presence.clear()
+    pending_joins.clear()
+
+    for frame in changes:
+        check_event(frame)
+    change_raw = {frame["from"]: json.dumps(frame) for frame in changes}
+    directory = {
+        pid: {"type": "presence", "from": pid, "data": p["meta"], "timestamp": p["last_seen"]}
+        for pid, p in peers.items()
+    } if joins else {}
+    directory_raw: Dict[str, str] = {}
+
+    async def send_to(pid: str, p: dict):
+        if pid in joins:
+            items = {other: frame for other, frame in directory.items() if other != pid}
+            raws = directory_raw
+        else:
+            items = {frame["from"]: frame for frame in changes if frame["from"] != pid}
+            raws = change_raw
+        if not items:
+            return
+        if "presence_batch" in p.get("features", ()):
+            await p["conn"].send_json({"type": "presence_batch", "data": {"peers": list(items.values())}})
+            return
+        for other, frame in items.items():
+            if other not in raws:
+                raws[other] = json.dumps(frame)
+            await p["conn"].send(raws[other])
+
+    # A peer that stopped reading must not hold the flush (and its frames) open
+    await asyncio.gather(
+        *(asyncio.wait_for(send_to(pid, p), SEND_TIMEOUT) for pid, p in list(peers.items()) if p["conn"] is not None),
+        return_exceptions=True
+    )
+
+
+def subscribe_logs(conn: Connection, msg: dict):
+    """Start or stop streaming relay-log events to a dashboard connection."""
+    if msg["type"] == "unsubscribe_logs":
+        log_subscribers.pop(conn, None)
+        return
+    level = msg.get("data", {}).get("level", "info")
+    log_subscribers[conn] = log.LEVELS.get(level, log.LEVELS["info"])
+    log.set_event_sink(asyncio.get_running_loop(), publish_log)
+
+
+def publish_log(data: dict):
+    """Log writer sink; runs on the event loop with an already rate-limited record."""
+    raw = json.dumps({"type": "relay-log", "data": data})
+    targets = [conn for conn, level in log_subscribers.items() if log.LEVELS[data["level"]] >= level]
+    if targets:
+        asyncio.ensure_future(asyncio.gather(*(conn.send(raw) for conn in targets), return_exceptions=True))
+
+
+def load_summary() -> dict:
+    """This relay's load for status surfaces and sibling relays."""
+    # Frames gathered for a batch or waiting on a slow transport, plus what it buffers
+    queue_depth = sum(len(conn.outbox) + conn.sending for conn in connections) + len(pending_presence)
+    queue_bytes = sum(conn.buffered_bytes() for conn in connections)
+    held_mail = sum(len(held) for held in mailbox.mailboxes.values())
+    return load.summary(
+        sum(1 for p in peers.values() if p["conn"] is not None), queue_depth, queue_bytes, held_mail
+    )
+
+
+def offline_frame(peer_id: str) -> dict:
+    return {"type": "presence", "from": peer_id, "data": {"status": "offline"}, "timestamp": time.time()}
+
+
+async def forward_chunk(upload: dict, raw: str):
+    """Stream one chunk frame to every recipient of an upload without re-serializing."""
+    async def send_one(pid: str):
+        p = peers.get(pid)
+        if not p or p["conn"] is None:
+            drop_recipient(upload, pid)
+            return
+        try:
+            await asyncio.wait_for(p["conn"].send(raw), CHUNK_SEND_TIMEOUT)
+        except Exception:
+            # Slow or dead recipient: stop streaming to it rather than buffering
+            drop_recipient(upload, pid)
+
+    await asyncio.gather(*(send_one(pid) for pid in list(upload["recipients"])))
+
+
+async def abort_upload(upload: dict, reason: str):
+    """Notify the owner and remaining recipients that an upload was abandoned."""
+    raw = json.dumps(abort_frame(upload["id"], reason))
+    for pid in [upload["owner"], *upload["recipients"]]:
+        p = peers.get(pid)
+        if p and p["conn"] is not None:
+            try:
+                await p["conn"].send(raw)
+            except Exception:
+                pass
+
+
+async def handle_chunk_message(conn: Connection, msg: dict, raw: str):
+    """Pass chunk_start/chunk/chunk_end frames through to recipients with flow control."""
+    mtype = msg["type"]
+    peer_id = conn.peer_id
+
+    if mtype == "chunk_start":
+        target = msg.get("to")
+        if target:
+            recipients = [target] if target in peers else []
+        else:
+            recipients = [pid for pid, p in peers.items() if pid != peer_id and p["conn"] is not None]
+        upload, error = open_upload(msg, peer_id, recipients)
+        if error:
+            await conn.send_json(abort_frame(msg.get("uploadId"), error))
+            return
+        await forward_chunk(upload, raw)
+
+    elif mtype == "chunk":
+        upload, error = accept_chunk(msg, peer_id, len(raw))
+        if error:
+            if upload:
+                await abort_upload(upload, error)
+            else:
+                await conn.send_json(abort_frame(msg.get("uploadId"), error))
+            return
+        await forward_chunk(upload, raw)
+
+    else:
+        upload = close_upload(msg.get("uploadId"), peer_id)
+        if upload:
+            await forward_chunk(upload, raw)
+        return
+
+    if not upload["recipients"]:
+        close_upload(upload["id"], peer_id)
+        await abort_upload(upload, "All recipients disconnected")
+        return
+    await conn.send_json(ack_frame(upload))
+
+
+async def handle_frame(conn: Connection, raw: str, received: Optional[float] = None):
+    """Route one inbound frame; received is its arrival time in epoch ms, for tracing."""
+    if received is None:
+        received = tracing.now_ms()
+    if len(raw) > MAX_FRAME_SIZE:
+        # Drop before parsing; large payloads must use chunk_start/chunk/chunk_end
+        await conn.send_json({"type": "error", "data": {"message": f"Frame of {len(raw)} bytes exceeds {MAX_FRAME_SIZE}"}})
+        return
+    msg = json.loads(raw)
+    mtype = msg.get("type")
+    error = check_message_size(mtype, len(raw))
+    if error:
+        await conn.send_json({"type": "error", "data": {"message": error}})
+        return
+
+    if mtype == "batch":
+        # Each frame in an inbound batch is routed exactly as if sent on its own
+        for item in msg.get("data", {}).get("frames", []):
+            if isinstance(item, dict) and item.get("type") != "batch":
+                await handle_frame(conn, json.dumps(item), received)
+
+    elif mtype in CHUNK_TYPES:
+        await handle_chunk_message(conn, msg, raw)
+
+    elif mtype in handlers:
+        await handlers[mtype](conn, msg)
+
+    elif mtype in ("subscribe_logs", "unsubscribe_logs"):
+        subscribe_logs(conn, msg)
+
+    elif mtype == "load":
+        await conn.send_json({"type": "load_response", "data": load_summary()})
+
+    elif mtype == "ping":
+        # Client-side RTT probe; answered at once with the relay's clock
+        await conn.send_json({"type": "pong", "data": {**msg.get("data", {}), "relayTime": tracing.now_ms()}})
+
+    elif mtype == "pong":
+        tracing.pong(conn.peer_id, msg.get("data", {}))
+
+    elif mtype == "get_latency":
+        await conn.send_json({"type": "latency_response", "data": tracing.snapshot()})
+
+    elif mtype == "presence":
+        new_peer_id = msg["from"]
+        existing = peers.get(new_peer_id)
+        peers[new_peer_id] = {
+            "conn": conn,
+            "last_seen": time.time(),
+            "meta": msg.get("data", {}),
+            # e.g. ["presence_batch", "batch"]
+            "features": set(msg.get("features") or ())
+        }
+        conn.peer_id = new_peer_id
+        conn.batching = "batch" in peers[new_peer_id]["features"]
+        joined = existing is None or existing["conn"] is not conn
+        # Newcomers get the directory with the next flush; repeat presence
+        # on the same connection is only relayed as a change
+        queue_presence(msg, joined=joined)
+        if joined and new_peer_id in mailbox.mailboxes:
+            await deliver_mail(conn, new_peer_id)
+
+    elif mtype == "heartbeat":
+        if conn.peer_id in peers:
+            peers[conn.peer_id]["last_seen"] = time.time()
+
+    elif mtype == "direct":
+        await send_direct(conn, msg, raw, tracing.begin(msg, received))
+
+    else:
+        # broadcast, stream, ack, turn_end, error, events
+        await broadcast(msg, exclude=conn.peer_id, raw=raw, trace=tracing.begin(msg, received))
+        if mtype in observers:
+            await observers[mtype](conn, msg)
+
+
+async def disconnect(conn: Connection):
+    """Forget a closed connection and announce its peer offline."""
+    connections.discard(conn)
+    log_subscribers.pop(conn, None)
+    peer_id = conn.peer_id
+    # While draining, peers are reconnecting to the successor; don't announce them offline.
+    # A peer that already reconnected on another socket keeps its new entry.
+    if peer_id and not relay_state["draining"] and peers.get(peer_id, {}).get("conn") is conn:
+        peers.pop(peer_id, None)
+        tracing.forget_peer(peer_id)
+        for upload in drop_peer_uploads(peer_id):
+            await abort_upload(upload, "Sender disconnected")
+        queue_presence(offline_frame(peer_id))
+
+
+async def serve(conn: Connection):
+    """Run one connection until it closes."""
+    redirect = load.redirect_frame(load_summary())
+    if redirect is not None:
+        # Overloaded: point the newcomer at a sibling before it joins the directory
+        log.info("connection", f"Redirecting new connection to {redirect['data'].get('url') or redirect['data'].get('arn')}")
+        try:
+            await conn.send_json(redirect)
+            await conn.close(1013, "redirect")
+        except Exception:
+            pass
+        return
+    connections.add(conn)
+    if capture.capturing():
+        conn.capture_id = capture.new_connection()
+    try:
+        async for raw in conn.frames():
+            received = tracing.now_ms()
+            if conn.capture_id is not None:
+                capture.record(conn.capture_id, conn.peer_id, raw)
+            load.count_message()
+            await handle_frame(conn, raw, received)
+    except Exception as e:
+        log.warn("connection", f"Connection error: {e}", peer=conn.peer_id)
+    finally:
+        if conn.capture_id is not None:
+            capture.close_connection(conn.capture_id, conn.peer_id)
+        await disconnect(conn)
+
+
+async def reap_stale():
+    """Remove stale peers that haven't sent heartbeat."""
+    while True:
+        await asyncio.sleep(REAP_INTERVAL)
+        for upload in expire_uploads():
+            await abort_upload(upload, "Upload timed out")
+        for entry in mailbox.expire():
+            await notify_sender(entry, "expired")
+        now = time.time()
+        stale = [pid for pid, p in peers.items() if now - p["last_seen"] > STALE_TIMEOUT]
+        for pid in stale:
+            p = peers.pop(pid, None)
+            tracing.forget_peer(pid)
+            if p:
+                if p["conn"] is not None:
+                    try:
+                        await p["conn"].close()
+                    except Exception:
+                        pass
+                for upload in drop_peer_uploads(pid):
+                    await abort_upload(upload, "Sender disconnected")
+                queue_presence(offline_frame(pid))
+
+
+async def probe_peers():
+    """Ping every peer that negotiated `ping` to sample its RTT."""
+    while True:
+        await asyncio.sleep(tracing.TRACE_PROBE_INTERVAL)
+        tracing.expire_probes()
+        for pid, p in list(peers.items()):
+            if p["conn"] is not None and "ping" in p.get("features", ()):
+                try:
+                    await asyncio.wait_for(p["conn"].send_json(tracing.probe_frame(pid)), SEND_TIMEOUT)
+                except Exception:
+                    pass  # the reaper deals with dead peers
+
+
+def ensure_reaper():
+    """Start the reaper and RTT prober once per process."""
+    if relay_state["reaper"] is None or relay_state["reaper"].done():
+        relay_state["reaper"] = asyncio.ensure_future(reap_stale())
+    if tracing.TRACE_PROBE_INTERVAL and (relay_state["prober"] is None or relay_state["prober"].done()):
+        relay_state["prober"] = asyncio.ensure_future(probe_peers())
+
+
+async def drain(reason: str):
+    """Ask every connection to reconnect after a random delay, then close them."""
+    relay_state["draining"] = True
+    for conn in list(connections):
+        hint = {
+            "type": "reconnect",
+            "data": {"reason": reason, "delayMs": int(random.uniform(0, DRAIN_RECONNECT_SPREAD) * 1000)}
+        }
+        try:
+            await conn.send_json(hint)
+        except Exception:
+            pass
+
+    await asyncio.sleep(DRAIN_GRACE)
+    await asyncio.gather(
+        *(conn.close(1012, reason) for conn in list(connections)),
+        return_exceptions=True
+    )
+    log.info("relay", f"Drained connections ({reason})")
@@ -0,0 +1,207 @@
+"""
+Relay-side task dispatch across the kiro-cli agents this relay manages.
+
+A `task-created` event without `assignedTo` is queued on the least-loaded
+running agent whose profile matches the task's `agent` field (any agent
+when the task names none). Each agent runs at most `maxConcurrentTasks`
+tasks (agent config, default 1); the rest wait in its queue. Tasks that no
+agent can take yet wait unassigned until a compatible agent starts.
+
+A task leaves its agent when the agent's ACP prompt turn for it ends, when
+a `task-status-changed` event reports it complete or failed, or when the
+agent exits. A task in flight longer than the agent's `taskTimeout`
+(TASK_TIMEOUT seconds by default) is marked for cancellation; it keeps its
+slot until the agent acknowledges the cancel by ending the turn. This module
+only keeps the books; the server sends tasks to agents and announces each
+transition as a `task-status-changed` event.
+"""
+
+import os
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_CONCURRENCY = 1
+# Seconds a task may stay in flight before the relay cancels it
+TASK_TIMEOUT = float(os.getenv("TASK_TIMEOUT", "1800"))
+# Tasks waiting for a compatible agent; older ones are failed to make room
+MAX_UNASSIGNED = 1000
+FINAL_STATUSES = ("complete", "failed")
+
+# agent_id -> {profile, limit, timeout, queue: deque of task ids, inFlight: set of task ids}
+slots: Dict[str, dict] = {}
+# task_id -> {task, agent, status, started (monotonic, once in flight), session, cancelled}
+tasks: Dict[str, dict] = {}
+# task ids waiting for a compatible agent, oldest first
+unassigned: deque = deque()
+
+
+def register_agent(agent_id: str, profile: str, limit: int = DEFAULT_CONCURRENCY,
+                   timeout: float = TASK_TIMEOUT):
+    """Make a running agent available for tasks (idempotent)."""
+    slot = slots.setdefault(agent_id, {"queue": deque(), "inFlight": set()})
+    slot.update(profile=profile, limit=max(1, int(limit)), timeout=float(timeout))
+
+
+def remove_agent(agent_id: str) -> Tuple[List[str], List[str]]:
+    """Take an agent out of rotation.
+
+    Returns (ids of tasks it was running, ids of tasks queued on it); the
+    first are lost, the second go back to unassigned for resubmission.
+    """
+    slot = slots.pop(agent_id, None)
+    if not slot:
+        return [], []
+    for task_id in slot["inFlight"]:
+        tasks.pop(task_id, None)
+    for task_id in slot["queue"]:
+        tasks[task_id].update(agent=None, status="pending")
+        unassigned.append(task_id)
+    return sorted(slot["inFlight"]), list(slot["queue"])
+
+
+def load(slot: dict) -> float:
+    return (len(slot["inFlight"]) + len(slot["queue"])) / slot["limit"]
+
+
+def pick_agent(task: dict) -> Optional[str]:
+    """Least-loaded agent whose profile matches the task."""
+    profile = task.get("agent")
+    candidates = [agent_id for agent_id, slot in slots.items() if not profile or slot["profile"] == profile]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda agent_id: (load(slots[agent_id]), agent_id))
+
+
+def submit(task: dict) -> Tuple[Optional[str], List[str]]:
+    """Queue a new task. Returns (assigned agent or None, ids of tasks dropped for room)."""
+    task_id = task["id"]
+    if task_id in tasks:
+        return tasks[task_id]["agent"], []
+    tasks[task_id] = {"task": task, "agent": None, "status": "pending"}
+    agent_id = pick_agent(task)
+    if agent_id is None:
+        unassigned.append(task_id)
+        dropped = []
+        while len(unassigned) > MAX_UNASSIGNED:
+            old = unassigned.popleft()
+            tasks.pop(old, None)
+            dropped.append(old)
+        return None, dropped
+    tasks[task_id]["agent"] = agent_id
+    slots[agent_id]["queue"].append(task_id)
+    return agent_id, []
+
+
+def assign_unassigned() -> List[Tuple[str, str]]:
+    """Place waiting tasks on agents that can now take them. Returns (task id, agent id) pairs."""
+    placed = []
+    for task_id in list(unassigned):
+        entry = tasks.get(task_id)
+        agent_id = pick_agent(entry["task"]) if entry else None
+        if agent_id is None:
+            continue
+        unassigned.remove(task_id)
+        entry["agent"] = agent_id
+        slots[agent_id]["queue"].append(task_id)
+        placed.append((task_id, agent_id))
+    return placed
+
+
+def start_ready(agent_id: str) -> List[dict]:
+    """Move queued tasks into flight up to the agent's limit. Returns the tasks to send."""
+    slot = slots.get(agent_id)
+    started = []
+    while slot and slot["queue"] and len(slot["inFlight"]) < slot["limit"]:
+        task_id = slot["queue"].popleft()
+        slot["inFlight"].add(task_id)
+        tasks[task_id].update(status="in-progress", started=time.monotonic())
+        started.append(tasks[task_id]["task"])
+    return started
+
+
+def finish(task_id: str, status: str) -> Optional[str]:
+    """Record a status reported by a peer. Returns the agent freed by a final status."""
+    entry = tasks.get(task_id)
+    if not entry:
+        return None
+    entry["status"] = status
+    if status not in FINAL_STATUSES:
+        return None
+    tasks.pop(task_id)
+    agent_id = entry["agent"]
+    slot = slots.get(agent_id)
+    if slot:
+        slot["inFlight"].discard(task_id)
+        if task_id in slot["queue"]:
+            slot["queue"].remove(task_id)
+    elif task_id in unassigned:
+        unassigned.remove(task_id)
+    return agent_id
+
+
+def expire(now: Optional[float] = None) -> List[Tuple[str, str]]:
+    """Mark in-flight tasks past their agent's timeout as cancelled.
+
+    Returns the (task id, agent id) pairs newly marked; they stay in flight
+    until the agent ends their turn.
+    """
+    now = time.monotonic() if now is None else now
+    expired = [
+        (task_id, agent_id)
+        for agent_id, slot in slots.items()
+        for task_id in slot["inFlight"]
+        if not tasks[task_id].get("cancelled") and now - tasks[task_id]["started"] >= slot["timeout"]
+    ]
+    for task_id, _ in expired:
+        tasks[task_id]["cancelled"] = True
+    return expired
+
+
+def summary() -> dict:
+    """Per-agent load for status surfaces and agent ranking."""
+    return {
+        "agents": {
+            agent_id: {"profile": slot["profile"], "limit": slot["limit"],
+                       "inFlight": len(slot["inFlight"]), "queued": len(slot["queue"])}
+            for agent_id, slot in slots.items()
+        },
+        "unassigned": len(unassigned)
+    }
+
+
+def snapshot() -> dict:
+    """Serializable copy of agents, tasks and the unassigned queue, for handing over to a successor relay."""
+    now = time.monotonic()
+    return {
+        "slots": {
+            agent_id: {**slot, "queue": list(slot["queue"]), "inFlight": sorted(slot["inFlight"])}
+            for agent_id, slot in slots.items()
+        },
+        # Monotonic start times become ages; the successor has its own clock
+        "tasks": {
+            task_id: {k: v for k, v in entry.items() if k != "started"}
+            | ({"age": now - entry["started"]} if "started" in entry else {})
+            for task_id, entry in tasks.items()
+        },
+        "unassigned": list(unassigned)
+    }
+
+
+def restore(saved: dict):
+    """Load tasks handed over by a predecessor relay."""
+    now = time.monotonic()
+    for agent_id, slot in saved.get("slots", {}).items():
+        slots[agent_id] = {**slot, "queue": deque(slot["queue"]), "inFlight": set(slot["inFlight"])}
+    for task_id, entry in saved.get("tasks", {}).items():
+        entry = dict(entry)
+        if "age" in entry:
+            entry["started"] = now - entry.pop("age")
+        tasks[task_id] = entry
+    unassigned.extend(saved.get("unassigned", []))
+
+
+def clear():
+    slots.clear()
+    tasks.clear()
+    unassigned.clear()
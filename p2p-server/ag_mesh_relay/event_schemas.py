@@ -74,13 +74,14 @@ EVENT_SCHEMAS = {
     "task-created": {
         "description": "A new task has been created",
         "required": ["id", "title", "createdBy", "timestamp"],
-        "optional": ["description", "parentId", "assignedTo"],
+        "optional": ["description", "parentId", "assignedTo", "agent"],
         "types": {
             "id": str,
             "title": str,
             "description": str,
             "parentId": str,
             "assignedTo": str,
+            "agent": str,
             "createdBy": str,
             "timestamp": (int, float)
         }
@@ -89,12 +90,13 @@ EVENT_SCHEMAS = {
     "task-status-changed": {
         "description": "A task has transitioned to a new status",
         "required": ["id", "status", "changedBy"],
-        "optional": ["previousStatus", "reason"],
+        "optional": ["previousStatus", "reason", "assignedTo"],
         "types": {
             "id": str,
             "status": ["pending", "in-progress", "blocked", "complete", "failed"],
             "previousStatus": ["pending", "in-progress", "blocked", "complete", "failed"],
             "reason": str,
+            "assignedTo": str,
             "changedBy": str
         }
     },
@@ -173,12 +175,13 @@ EVENT_SCHEMAS = {
     "relay-capabilities": {
         "description": "Relay server announcing available agents and tools",
         "required": ["relayId"],
-        "optional": ["agentCards", "activeAgents", "tools"],
+        "optional": ["agentCards", "activeAgents", "tools", "load"],
         "types": {
             "relayId": str,
             "agentCards": list,
             "activeAgents": list,
-            "tools": list
+            "tools": list,
+            "load": dict
         }
     },
     
@@ -187,7 +190,7 @@ EVENT_SCHEMAS = {
         "required": ["status"],
         "optional": ["type", "agent", "agents", "hostname", "pageId"],
         "types": {
-            "status": ["online", "offline"],
+            "status": ["online", "offline", "idle", "stopped"],
             "type": str,
             "agent": str,
             "agents": list,
@@ -0,0 +1,199 @@
+"""
+Zero-downtime restart: hand the listening sockets, peer directory, agent
+processes, held direct messages and dispatched tasks over to a freshly
+started relay process.
+
+The old relay writes a snapshot, starts `python -m ag_mesh_relay.server` with
+AG_MESH_HANDOFF pointing at it and the listening sockets and agent pipes
+inherited via pass_fds, and waits for the successor to signal readiness on a
+pipe before draining its own connections. Agents keep running throughout;
+the successor adopts them by pid and pipe descriptors, and takes over the
+ACP requests still waiting for a reply on those pipes.
+"""
+
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+from . import log
+
+HANDOFF_ENV = "AG_MESH_HANDOFF"
+HANDOFF_TIMEOUT = 15
+
+
+class AdoptedProcess:
+    """Popen look-alike for an agent process inherited from a previous relay."""
+
+    def __init__(self, pid: int, fds: List[Optional[int]]):
+        self.pid = pid
+        self.args = ["kiro-cli", "acp"]
+        self.returncode = None
+        stdin, stdout, stderr = fds
+        self.stdin = os.fdopen(stdin, "w", buffering=1) if stdin is not None else None
+        self.stdout = os.fdopen(stdout, "r") if stdout is not None else None
+        self.stderr = os.fdopen(stderr, "r") if stderr is not None else None
+
+    def poll(self) -> Optional[int]:
+        # Not our child, so it cannot be waited on; probe for existence instead
+        if self.returncode is None:
+            try:
+                os.kill(self.pid, 0)
+            except ProcessLookupError:
+                self.returncode = -1
+            except PermissionError:
+                pass
+        return self.returncode
+
+    def send_signal(self, sig: int):
+        if self.poll() is None:
+            try:
+                os.kill(self.pid, sig)
+            except ProcessLookupError:
+                self.returncode = -1
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+    def wait(self, timeout: Optional[float] = None) -> int:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.poll() is None:
+            if deadline is not None and time.monotonic() > deadline:
+                raise subprocess.TimeoutExpired(self.args, timeout)
+            time.sleep(0.1)
+        return self.returncode
+
+
+def spawn_successor(sockets: list, peers: Dict[str, dict], agents: Dict[str, dict],
+                    mailboxes: Optional[Dict[str, list]] = None, tasks: Optional[dict] = None,
+                    channels: Optional[Dict[str, dict]] = None) -> Tuple[subprocess.Popen, int]:
+    """Start a new relay process that inherits sockets, peers, agents, held mail and tasks.
+
+    Returns the successor process and the read end of its readiness pipe.
+    """
+    listen_fds = [s.fileno() for s in sockets]
+    pass_fds = list(listen_fds)
+
+    agent_entries = {}
+    for agent_id, agent in agents.items():
+        proc = agent["process"]
+        if proc is None:
+            # Stopped while idle; the successor relaunches it on demand
+            pid, fds = None, [None, None, None]
+        elif proc.poll() is not None:
+            continue
+        else:
+            pid = proc.pid
+            fds = [f.fileno() if f else None for f in (proc.stdin, proc.stdout, proc.stderr)]
+            pass_fds += [fd for fd in fds if fd is not None]
+        agent_entries[agent_id] = {
+            "pid": pid,
+            "fds": fds,
+            **{k: v for k, v in agent.items() if k not in ("process", "waking")}
+        }
+
+    ready_r, ready_w = os.pipe()
+    pass_fds.append(ready_w)
+
+    snapshot = {
+        "version": 1,
+        "created": time.time(),
+        "listenFds": listen_fds,
+        "readyFd": ready_w,
+        "peers": {
+            pid: {"meta": p["meta"], "last_seen": p["last_seen"]}
+            for pid, p in peers.items()
+        },
+        "agents": agent_entries,
+        "mailboxes": mailboxes or {},
+        "tasks": tasks or {},
+        "acp": channels or {}
+    }
+    fd, path = tempfile.mkstemp(prefix="ag-mesh-handoff-", suffix=".json")
+    with os.fdopen(fd, "w") as f:
+        json.dump(snapshot, f)
+
+    env = dict(os.environ, **{HANDOFF_ENV: path})
+    # The successor would truncate the capture file we are still writing
+    env.pop("CAPTURE_FILE", None)
+    proc = subprocess.Popen([sys.executable, "-m", "ag_mesh_relay.server"], env=env, pass_fds=pass_fds)
+    os.close(ready_w)
+    return proc, ready_r
+
+
+async def wait_ready(ready_fd: int, timeout: float = HANDOFF_TIMEOUT) -> bool:
+    """Wait for the successor to report that it is serving."""
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+
+    def on_readable():
+        if not done.done():
+            done.set_result(os.read(ready_fd, 1) == b"1")
+
+    loop.add_reader(ready_fd, on_readable)
+    try:
+        return await asyncio.wait_for(done, timeout)
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        loop.remove_reader(ready_fd)
+        os.close(ready_fd)
+
+
+def load_handoff() -> Optional[dict]:
+    """Read and remove the snapshot left by a predecessor, if any."""
+    path = os.environ.pop(HANDOFF_ENV, None)
+    if not path:
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        log.error("handoff", f"Ignoring unreadable handoff snapshot {path}: {e}")
+        return None
+    finally:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def inherited_sockets(snapshot: dict) -> list:
+    """Wrap the listening sockets passed down by the predecessor."""
+    return [socket.socket(fileno=fd) for fd in snapshot.get("listenFds", [])]
+
+
+def adopt_agents(snapshot: dict) -> Dict[str, dict]:
+    """Rebuild the agents table from the predecessor's running processes."""
+    adopted = {}
+    for agent_id, entry in snapshot.get("agents", {}).items():
+        entry = dict(entry)
+        pid, fds = entry.pop("pid"), entry.pop("fds")
+        if pid is None:
+            adopted[agent_id] = {"process": None, **entry}
+            continue
+        proc = AdoptedProcess(pid, fds)
+        if proc.poll() is None:
+            adopted[agent_id] = {"process": proc, **entry}
+    return adopted
+
+
+def signal_ready(snapshot: dict):
+    """Tell the predecessor we are accepting connections."""
+    fd = snapshot.get("readyFd")
+    if fd is None:
+        return
+    try:
+        os.write(fd, b"1")
+        os.close(fd)
+    except OSError:
+        pass
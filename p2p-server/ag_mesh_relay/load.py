@@ -0,0 +1,171 @@
+"""
+Relay load summary and overload redirects.
+
+Each relay summarizes its load as peers, inbound messages per second,
+queue depth (frames gathered for a batch, frames waiting on a transport
+that pushes back, and pending presence), bytes sitting in transport write
+buffers and process CPU, plus a `score`: the largest of those as a
+fraction of its capacity (MAX_PEERS, MAX_MSG_RATE, MAX_QUEUE_DEPTH,
+MAX_QUEUE_BYTES, one core). Mail held
+for offline peers is reported as `heldMail` but left out of the score:
+it waits on its recipient coming back, not on this relay. The summary is
+published on the status surfaces and in capabilities_response /
+`load_response`.
+
+When the score is at or above LOAD_WATERMARK, new connections are sent
+
+    {type: 'redirect', data: {url} or {arn, region}, reason, load}
+
+and closed with 1013, pointing at the least-loaded sibling from
+RELAY_SIBLINGS (comma-separated ws:// URLs or AgentCore runtime ARNs).
+A sibling whose load is unknown is chosen only when no reported one is
+below the watermark; siblings that are themselves over it, or that could
+not be reached, are never chosen. Without siblings nothing is redirected.
+"""
+
+import os
+import random
+import time
+from typing import Dict, List, Optional
+
+MAX_PEERS = int(os.getenv("MAX_PEERS", "1000"))
+MAX_MSG_RATE = float(os.getenv("MAX_MSG_RATE", "2000"))
+MAX_QUEUE_DEPTH = int(os.getenv("MAX_QUEUE_DEPTH", "10000"))
+MAX_QUEUE_BYTES = int(os.getenv("MAX_QUEUE_BYTES", str(64 * 1024 * 1024)))
+LOAD_WATERMARK = float(os.getenv("LOAD_WATERMARK", "0.8"))
+RELAY_SIBLINGS = os.getenv("RELAY_SIBLINGS", "")
+# Rates and CPU are averaged over samples at least this many seconds apart
+LOAD_SAMPLE_INTERVAL = 1.0
+# Weight of the newest sample in the moving averages
+LOAD_SMOOTHING = 0.3
+# Reported sibling loads older than this are treated as unknown
+SIBLING_LOAD_TTL = 60
+
+# max_peers, max_msg_rate, max_queue_depth, max_queue_bytes, watermark
+limits: dict = {
+    "max_peers": MAX_PEERS, "max_msg_rate": MAX_MSG_RATE, "max_queue_depth": MAX_QUEUE_DEPTH,
+    "max_queue_bytes": MAX_QUEUE_BYTES, "watermark": LOAD_WATERMARK,
+}
+# inbound messages since the last sample, smoothed rate and CPU, last sample times
+_state: dict = {
+    "messages": 0, "rate": 0.0, "cpu": 0.0,
+    "sampled": time.monotonic(), "cpu_time": time.process_time(),
+}
+# sibling key (url or arn) -> {target, load, reachable, updated}
+siblings: Dict[str, dict] = {}
+stats = {"redirected": 0}
+
+
+def parse_sibling(entry) -> Optional[dict]:
+    """A sibling as a redirect target: {url} or {arn, region} (region taken from the ARN)."""
+    if isinstance(entry, dict):
+        return dict(entry) if entry.get("url") or entry.get("arn") else None
+    entry = str(entry).strip()
+    if not entry:
+        return None
+    if entry.startswith("arn:"):
+        parts = entry.split(":")
+        return {"arn": entry, "region": parts[3] if len(parts) > 3 else None}
+    return {"url": entry}
+
+
+def configure(server_config: Optional[dict] = None):
+    """Apply the `server` config section over the environment defaults."""
+    server_config = server_config or {}
+    for key, name in (("maxPeers", "max_peers"), ("maxMsgRate", "max_msg_rate"),
+                      ("maxQueueDepth", "max_queue_depth"), ("maxQueueBytes", "max_queue_bytes"),
+                      ("loadWatermark", "watermark")):
+        if key in server_config:
+            limits[name] = server_config[key]
+    entries = server_config.get("siblings", RELAY_SIBLINGS.split(","))
+    siblings.clear()
+    for entry in entries:
+        target = parse_sibling(entry)
+        if target:
+            key = target.get("url") or target["arn"]
+            siblings[key] = {"target": target, "load": None, "reachable": True, "updated": 0.0}
+
+
+def count_message():
+    _state["messages"] += 1
+
+
+def sample():
+    """Fold messages and CPU time since the last sample into the moving averages."""
+    now = time.monotonic()
+    elapsed = now - _state["sampled"]
+    if elapsed < LOAD_SAMPLE_INTERVAL:
+        return
+    cpu_time = time.process_time()
+    rate = _state["messages"] / elapsed
+    cpu = (cpu_time - _state["cpu_time"]) / elapsed
+    _state["rate"] += LOAD_SMOOTHING * (rate - _state["rate"])
+    _state["cpu"] += LOAD_SMOOTHING * (cpu - _state["cpu"])
+    _state.update(messages=0, sampled=now, cpu_time=cpu_time)
+
+
+def summary(peer_count: int, queue_depth: int, queue_bytes: int = 0, held_mail: int = 0) -> dict:
+    sample()
+    score = max(
+        peer_count / limits["max_peers"],
+        _state["rate"] / limits["max_msg_rate"],
+        queue_depth / limits["max_queue_depth"],
+        queue_bytes / limits["max_queue_bytes"],
+        _state["cpu"],
+    )
+    return {
+        "peers": peer_count,
+        "msgsPerSec": round(_state["rate"], 1),
+        "queueDepth": queue_depth,
+        "queueBytes": queue_bytes,
+        "heldMail": held_mail,
+        "cpu": round(_state["cpu"], 3),
+        "score": round(score, 3),
+        "watermark": limits["watermark"],
+    }
+
+
+def report_sibling(key: str, load: Optional[dict]):
+    """Record a sibling's published summary (None when it could not be reached)."""
+    sibling = siblings.get(key)
+    if sibling is not None:
+        sibling.update(load=load, reachable=load is not None, updated=time.monotonic())
+
+
+def pick_sibling() -> Optional[dict]:
+    """Least-loaded sibling below the watermark, else a random unreported one."""
+    now = time.monotonic()
+    known, unknown = [], []
+    for sibling in siblings.values():
+        fresh = now - sibling["updated"] < SIBLING_LOAD_TTL
+        if fresh and not sibling["reachable"]:
+            continue
+        load = sibling["load"] if fresh else None
+        if load is None:
+            unknown.append(sibling)
+        elif load.get("score", 1.0) < limits["watermark"]:
+            known.append(sibling)
+    if known:
+        return min(known, key=lambda s: s["load"]["score"])["target"]
+    if unknown:
+        return random.choice(unknown)["target"]
+    return None
+
+
+def redirect_frame(load: dict) -> Optional[dict]:
+    """The redirect for a new connection, or None when it should be accepted here."""
+    if not siblings or load["score"] < limits["watermark"]:
+        return None
+    target = pick_sibling()
+    if target is None:
+        return None
+    stats["redirected"] += 1
+    return {"type": "redirect", "data": {**target, "reason": "overloaded", "load": load}}
+
+
+def sibling_urls() -> List[str]:
+    """Siblings this relay can poll itself (AgentCore siblings need signed URLs)."""
+    return [key for key, sibling in siblings.items() if "url" in sibling["target"]]
+
+
+configure()
@@ -0,0 +1,210 @@
+"""
+Non-blocking structured logging for the relays.
+
+log() only checks the category's level and puts the record on a bounded
+queue; a background thread formats and writes it, so a slow stdout never
+stalls the event loop. When the queue is full records are dropped and
+counted rather than waited for.
+
+The writer aggregates repeats: the first record with a given category,
+level and message is written at once, further copies within
+LOG_AGGREGATE_WINDOW seconds are only counted and written as one summary
+("... x37 in last 10s") when the window closes.
+
+Levels are set per category, e.g.
+
+    LOG_LEVEL=info LOG_LEVELS=validation=error,connection=warn LOG_FORMAT=json
+
+Records at info and above can also be published as `relay-log` events
+through set_event_sink(), limited to LOG_EVENT_RATE per second.
+"""
+
+import atexit
+import json
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+LEVELS = {"debug": 10, "info": 20, "warn": 30, "error": 40}
+LOG_LEVEL = os.getenv("LOG_LEVEL", "info")
+# category=level pairs overriding LOG_LEVEL
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+# text or json (one object per line)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_AGGREGATE_WINDOW = float(os.getenv("LOG_AGGREGATE_WINDOW", "10"))
+LOG_QUEUE_SIZE = 10000
+# relay-log events published per second, and how many may go out at once
+LOG_EVENT_RATE = float(os.getenv("LOG_EVENT_RATE", "5"))
+LOG_EVENT_BURST = 20
+RELAY_ID = os.getenv("RELAY_ID", socket.gethostname())
+
+_default = LEVELS.get(LOG_LEVEL, LEVELS["info"])
+# category -> minimum level number
+levels: Dict[str, int] = {
+    category.strip(): LEVELS[level.strip()]
+    for category, _, level in (pair.partition("=") for pair in LOG_LEVELS.split(",") if "=" in pair)
+    if level.strip() in LEVELS
+}
+
+_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+# writer thread, records dropped on a full queue, event sink and its loop
+_state: dict = {"thread": None, "dropped": 0, "sink": None, "loop": None}
+stats = {"written": 0, "aggregated": 0, "dropped": 0, "events": 0, "eventsDropped": 0}
+
+
+def set_level(category: str, level: str):
+    levels[category] = LEVELS[level]
+
+
+def enabled(category: str, level: str) -> bool:
+    return LEVELS[level] >= levels.get(category, _default)
+
+
+def log(category: str, level: str, message: str, **data):
+    """Queue a record for the writer thread; never blocks."""
+    if not enabled(category, level):
+        return
+    if _state["thread"] is None:
+        _start()
+    try:
+        _queue.put_nowait((time.time(), category, level, message, data))
+    except queue.Full:
+        _state["dropped"] += 1
+
+
+def debug(category: str, message: str, **data):
+    log(category, "debug", message, **data)
+
+
+def info(category: str, message: str, **data):
+    log(category, "info", message, **data)
+
+
+def warn(category: str, message: str, **data):
+    log(category, "warn", message, **data)
+
+
+def error(category: str, message: str, **data):
+    log(category, "error", message, **data)
+
+
+def set_event_sink(loop, sink: Optional[Callable[[dict], None]]):
+    """Publish info-and-above records as relay-log event data via sink(data), called on loop."""
+    _state.update(loop=loop, sink=sink)
+
+
+def format_record(t: float, category: str, level: str, message: str, data: dict, count: int = 1) -> str:
+    if count > 1:
+        message = f"{message} ×{count} in last {LOG_AGGREGATE_WINDOW:g}s"
+    if LOG_FORMAT == "json":
+        return json.dumps({"time": t, "level": level, "category": category, "message": message,
+                           **({"count": count} if count > 1 else {}), **data}, default=str)
+    prefix = "" if level == "info" else f"{level.upper()} "
+    return f"{prefix}[{category}] {message}"
+
+
+class _Writer:
+    """State owned by the writer thread."""
+
+    def __init__(self):
+        # (category, level, message) -> [window start, repeats, last record]
+        self.repeats: Dict[tuple, list] = {}
+        self.tokens = float(LOG_EVENT_BURST)
+        self.updated = time.monotonic()
+
+    def run(self):
+        while True:
+            try:
+                record = _queue.get(timeout=min(1.0, LOG_AGGREGATE_WINDOW))
+            except queue.Empty:
+                record = None
+            if record is _STOP:
+                self.close_windows(force=True)
+                return
+            if record is not None:
+                self.handle(record)
+            self.close_windows()
+            if _state["dropped"]:
+                dropped, _state["dropped"] = _state["dropped"], 0
+                stats["dropped"] += dropped
+                self.emit(time.time(), "log", "warn", f"Dropped {dropped} log records (queue full)", {})
+
+    def handle(self, record: tuple):
+        t, category, level, message, data = record
+        key = (category, level, message)
+        window = self.repeats.get(key)
+        if window is not None:
+            window[1] += 1
+            window[2] = record
+            stats["aggregated"] += 1
+            return
+        self.repeats[key] = [t, 0, record]
+        self.emit(t, category, level, message, data)
+
+    def close_windows(self, force: bool = False):
+        now = time.time()
+        for key, (start, count, record) in list(self.repeats.items()):
+            if force or now - start >= LOG_AGGREGATE_WINDOW:
+                del self.repeats[key]
+                if count:
+                    t, category, level, message, data = record
+                    self.emit(t, category, level, message, data, count)
+
+    def emit(self, t: float, category: str, level: str, message: str, data: dict, count: int = 1):
+        try:
+            sys.stdout.write(format_record(t, category, level, message, data, count) + "\n")
+            sys.stdout.flush()
+        except (OSError, ValueError):
+            pass
+        stats["written"] += 1
+        if _state["sink"] is not None and LEVELS[level] >= LEVELS["info"]:
+            self.publish(t, category, level, message, data, count)
+
+    def publish(self, t: float, category: str, level: str, message: str, data: dict, count: int):
+        now = time.monotonic()
+        self.tokens = min(LOG_EVENT_BURST, self.tokens + (now - self.updated) * LOG_EVENT_RATE)
+        self.updated = now
+        if self.tokens < 1:
+            stats["eventsDropped"] += 1
+            return
+        self.tokens -= 1
+        event = {
+            "time": int(t * 1000),
+            "level": level,
+            "relayId": RELAY_ID,
+            "message": f"[{category}] {message}" + (f" ×{count} in last {LOG_AGGREGATE_WINDOW:g}s" if count > 1 else ""),
+            "data": {"category": category, "count": count, **data} if data or count > 1 else None
+        }
+        loop, sink = _state["loop"], _state["sink"]
+        try:
+            loop.call_soon_threadsafe(sink, json.loads(json.dumps(event, default=str)))
+            stats["events"] += 1
+        except RuntimeError:
+            pass  # loop closed
+
+
+_STOP = object()
+
+
+def _start():
+    thread = threading.Thread(target=_Writer().run, name="ag-mesh-log", daemon=True)
+    _state["thread"] = thread
+    thread.start()
+    atexit.register(stop)
+
+
+def stop(timeout: float = 2.0):
+    """Write out pending records and summaries, then stop the writer thread."""
+    thread = _state["thread"]
+    if thread is None:
+        return
+    _state["thread"] = None
+    try:
+        _queue.put(_STOP, timeout=timeout)
+    except queue.Full:
+        return
+    thread.join(timeout)
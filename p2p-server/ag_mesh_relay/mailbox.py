@@ -0,0 +1,112 @@
+"""
+Store-and-forward mailboxes for direct messages to peers that are offline or
+reconnecting.
+
+A direct message whose target is not connected is held in a bounded
+per-recipient mailbox (MAILBOX_TTL seconds, MAILBOX_MAX_MESSAGES and
+MAILBOX_MAX_BYTES each) and delivered in one burst when the recipient's
+presence arrives. The sender is told what happened to it:
+
+    {type: 'direct_status', data: {to, turnId?, id?, status}}
+
+status is 'queued', then 'delivered', 'expired' (TTL passed) or 'dropped'
+(evicted to make room, or no room at all).
+"""
+
+import os
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+MAILBOX_TTL = float(os.getenv("MAILBOX_TTL", "60"))
+MAILBOX_MAX_MESSAGES = 100
+MAILBOX_MAX_BYTES = 256 * 1024
+# Distinct recipients with pending mail; bounds memory for unknown targets
+MAILBOX_MAX_RECIPIENTS = 1000
+
+# recipient peer_id -> deque of {raw, sender, size, expires, to, turnId, id}
+mailboxes: Dict[str, deque] = {}
+# recipient peer_id -> bytes held
+mailbox_bytes: Dict[str, int] = {}
+
+
+def store(target: str, msg: dict, raw: str, sender: Optional[str]) -> Tuple[Optional[dict], List[dict]]:
+    """Hold a direct message for target.
+
+    Returns (entry or None if it could not be held, entries evicted to make room).
+    """
+    entry = {
+        "raw": raw,
+        "sender": sender,
+        "size": len(raw),
+        "expires": time.time() + MAILBOX_TTL,
+        "to": target,
+        "turnId": msg.get("turnId"),
+        "id": msg.get("id")
+    }
+    if entry["size"] > MAILBOX_MAX_BYTES:
+        return None, []
+    if target not in mailboxes and len(mailboxes) >= MAILBOX_MAX_RECIPIENTS:
+        return None, []
+
+    box = mailboxes.setdefault(target, deque())
+    evicted = []
+    while box and (len(box) >= MAILBOX_MAX_MESSAGES or mailbox_bytes.get(target, 0) + entry["size"] > MAILBOX_MAX_BYTES):
+        old = box.popleft()
+        mailbox_bytes[target] -= old["size"]
+        evicted.append(old)
+    box.append(entry)
+    mailbox_bytes[target] = mailbox_bytes.get(target, 0) + entry["size"]
+    return entry, evicted
+
+
+def take(target: str) -> List[dict]:
+    """Remove and return everything held for target, oldest first, skipping expired mail."""
+    box = mailboxes.pop(target, None)
+    mailbox_bytes.pop(target, None)
+    if not box:
+        return []
+    now = time.time()
+    return [entry for entry in box if entry["expires"] > now]
+
+
+def expire(now: Optional[float] = None) -> List[dict]:
+    """Drop mail past its TTL; called from the reaper."""
+    now = now or time.time()
+    expired = []
+    for target in list(mailboxes):
+        box = mailboxes[target]
+        while box and box[0]["expires"] <= now:
+            entry = box.popleft()
+            mailbox_bytes[target] -= entry["size"]
+            expired.append(entry)
+        if not box:
+            mailboxes.pop(target)
+            mailbox_bytes.pop(target, None)
+    return expired
+
+
+def status_frame(entry: dict, status: str) -> dict:
+    """Delivery report for the sender of a held message."""
+    data = {"to": entry["to"], "status": status}
+    for field in ("turnId", "id"):
+        if entry.get(field) is not None:
+            data[field] = entry[field]
+    return {"type": "direct_status", "data": data}
+
+
+def snapshot() -> Dict[str, list]:
+    """Serializable copy of all mailboxes, for handing over to a successor relay."""
+    return {target: list(box) for target, box in mailboxes.items()}
+
+
+def restore(saved: Dict[str, list]):
+    """Load mailboxes handed over by a predecessor relay."""
+    for target, entries in saved.items():
+        mailboxes[target] = deque(entries)
+        mailbox_bytes[target] = sum(entry["size"] for entry in entries)
+
+
+def clear():
+    mailboxes.clear()
+    mailbox_bytes.clear()
@@ -0,0 +1,242 @@
+"""Replay a relay traffic capture against a running relay and report on it.
+
+    ag-mesh-replay capture.jsonl.gz ws://localhost:10000 --speed 10 --report new.json
+    ag-mesh-replay capture.jsonl.gz ws://localhost:10001 --speed 10 --baseline new.json
+
+Each captured connection is reopened and its frames are re-sent in the
+original global order, with gaps scaled by --speed (1, 10, ... or max).
+Everything each connection receives is fingerprinted so two runs against
+different relay builds can be compared for divergence in delivered messages.
+Batch envelopes are split into the frames inside them, and the relay's own
+RTT probes are not counted, so batching decisions don't show up as
+divergence.
+"""
+
+import argparse
+import asyncio
+import bisect
+import hashlib
+import json
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+import websockets
+
+from .capture import load_capture
+
+# Relay-stamped fields that differ between runs of the same traffic
+VOLATILE_FIELDS = ("timestamp", "trace")
+VOLATILE_DATA_FIELDS = ("relayTime",)
+
+
+def fingerprint(raw) -> str:
+    """Stable digest of a frame, ignoring key order and volatile fields."""
+    try:
+        msg = json.loads(raw)
+    except ValueError:
+        return "invalid"
+    if isinstance(msg, dict):
+        for field in VOLATILE_FIELDS:
+            msg.pop(field, None)
+        if isinstance(msg.get("data"), dict):
+            for field in VOLATILE_DATA_FIELDS:
+                msg["data"].pop(field, None)
+    canonical = json.dumps(msg, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(canonical.encode(), digest_size=8).hexdigest()
+
+
+def unbatch(raw: str) -> List[str]:
+    """Split batch and presence_batch frames so batching decisions don't count as differences."""
+    try:
+        msg = json.loads(raw)
+    except ValueError:
+        return [raw]
+    if not isinstance(msg, dict):
+        return [raw]
+    if msg.get("type") == "batch":
+        return [item for frame in msg.get("data", {}).get("frames", []) for item in unbatch(json.dumps(frame))]
+    if msg.get("type") == "presence_batch":
+        return [json.dumps(item) for item in msg.get("data", {}).get("peers", [])]
+    return [raw]
+
+
+def is_probe(raw: str) -> bool:
+    """A relay RTT probe, sent on the relay's own schedule."""
+    try:
+        msg = json.loads(raw)
+    except ValueError:
+        return False
+    return isinstance(msg, dict) and msg.get("type") == "ping"
+
+
+def percentiles(samples: List[float]) -> dict:
+    """p50/p90/p99/max of a list of values."""
+    if not samples:
+        return {"samples": 0}
+    s = sorted(samples)
+
+    def pick(q):
+        return round(s[min(len(s) - 1, int(q * len(s)))], 3)
+
+    return {"samples": len(s), "p50": pick(0.5), "p90": pick(0.9), "p99": pick(0.99), "max": round(s[-1], 3)}
+
+
+async def replay(path: str, url: str, speed: Optional[float], drain: float) -> dict:
+    """Drive the capture at url. speed=None replays as fast as possible."""
+    entries = load_capture(path)
+    header = next(entries, {})
+
+    conns: Dict[int, object] = {}
+    readers: List[asyncio.Task] = []
+    sent_at: Dict[str, List[float]] = defaultdict(list)
+    deliveries: Dict[str, Counter] = defaultdict(Counter)
+    latencies: List[float] = []
+    counts = Counter()
+    last_recv = [time.monotonic()]
+
+    async def read(conn: int, ws):
+        try:
+            async for raw in ws:
+                now = time.monotonic()
+                last_recv[0] = now
+                for item in unbatch(raw):
+                    if is_probe(item):
+                        continue
+                    counts["received"] += 1
+                    fp = fingerprint(item)
+                    deliveries[str(conn)][fp] += 1
+                    times = sent_at.get(fp)
+                    if times:
+                        i = bisect.bisect_right(times, now)
+                        if i:
+                            latencies.append((now - times[i - 1]) * 1000)
+        except Exception:
+            pass
+
+    start = time.monotonic()
+    for entry in entries:
+        if speed:
+            delay = start + entry["t"] / speed - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        conn = entry["c"]
+        kind = entry["k"]
+        if kind == "open":
+            try:
+                ws = await websockets.connect(url, max_size=None)
+            except Exception as e:
+                counts["errors"] += 1
+                print(f"[Replay] connection {conn} failed: {e}", file=sys.stderr)
+                continue
+            conns[conn] = ws
+            readers.append(asyncio.create_task(read(conn, ws)))
+        elif kind == "msg":
+            ws = conns.get(conn)
+            if ws is None:
+                continue
+            try:
+                await ws.send(entry["m"])
+            except Exception:
+                counts["errors"] += 1
+                conns.pop(conn, None)
+                continue
+            counts["sent"] += 1
+            sent_at[fingerprint(entry["m"])].append(time.monotonic())
+        elif kind == "close":
+            ws = conns.pop(conn, None)
+            if ws is not None:
+                await ws.close()
+
+    elapsed = time.monotonic() - start
+
+    # Let in-flight deliveries arrive, then hang up everything still open
+    while time.monotonic() - last_recv[0] < drain:
+        await asyncio.sleep(0.1)
+    for ws in conns.values():
+        await ws.close()
+    await asyncio.gather(*readers, return_exceptions=True)
+
+    return {
+        "capture": path,
+        "target": url,
+        "speed": speed or "max",
+        "redacted": header.get("redacted", False),
+        "duration": round(elapsed, 3),
+        "sent": counts["sent"],
+        "received": counts["received"],
+        "errors": counts["errors"],
+        "sendRate": round(counts["sent"] / elapsed, 1) if elapsed else None,
+        "receiveRate": round(counts["received"] / elapsed, 1) if elapsed else None,
+        "latencyMs": percentiles(latencies),
+        "deliveries": {conn: dict(c) for conn, c in deliveries.items()}
+    }
+
+
+def divergence(baseline: dict, current: dict) -> dict:
+    """Compare per-connection deliveries of two replay reports."""
+    missing = extra = 0
+    conns = {}
+    for conn in set(baseline["deliveries"]) | set(current["deliveries"]):
+        before = Counter(baseline["deliveries"].get(conn, {}))
+        after = Counter(current["deliveries"].get(conn, {}))
+        lost = sum((before - after).values())
+        added = sum((after - before).values())
+        if lost or added:
+            conns[conn] = {"missing": lost, "extra": added}
+        missing += lost
+        extra += added
+    return {"missing": missing, "extra": extra, "connections": conns}
+
+
+def print_report(report: dict):
+    lat = report["latencyMs"]
+    print(f"Replayed {report['capture']} -> {report['target']} at speed {report['speed']}")
+    print(f"  sent {report['sent']} ({report['sendRate']}/s), received {report['received']} "
+          f"({report['receiveRate']}/s), errors {report['errors']}, {report['duration']}s")
+    if lat["samples"]:
+        print(f"  latency ms p50 {lat['p50']} p90 {lat['p90']} p99 {lat['p99']} max {lat['max']} "
+              f"({lat['samples']} samples)")
+    div = report.get("divergence")
+    if div:
+        print(f"  divergence vs baseline: {div['missing']} missing, {div['extra']} extra "
+              f"across {len(div['connections'])} connections")
+
+
+def parse_speed(value: str) -> Optional[float]:
+    if value == "max":
+        return None
+    speed = float(value)
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("speed must be positive or 'max'")
+    return speed
+
+
+def main():
+    """CLI entry point."""
+    parser = argparse.ArgumentParser(description="Replay captured relay traffic")
+    parser.add_argument("capture", help="capture file written with CAPTURE_FILE")
+    parser.add_argument("url", nargs="?", default="ws://localhost:10000", help="relay to drive")
+    parser.add_argument("--speed", type=parse_speed, default=1.0, help="time scale: 1, 10, ... or max")
+    parser.add_argument("--drain", type=float, default=2.0, help="seconds of silence before stopping")
+    parser.add_argument("--report", help="write the JSON report here")
+    parser.add_argument("--baseline", help="earlier report to compare deliveries against")
+    args = parser.parse_args()
+
+    report = asyncio.run(replay(args.capture, args.url, args.speed, args.drain))
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["divergence"] = divergence(json.load(f), report)
+
+    print_report(report)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    if report.get("divergence", {}).get("missing"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,24 +4,35 @@
 import asyncio
 import json
 import os
+import signal
 import subprocess
 import time
 from pathlib import Path
 from typing import Dict, Optional
 
 import websockets
-from websockets.server import WebSocketServerProtocol
 
-from .event_schemas import validate_event, export_schemas_json
+from . import acp, admission, capability_index, capture, core, dispatcher, handoff, load, log, mailbox
+from .agent_cards import AGENT_CARDS
+from .chunking import MAX_FRAME_SIZE
+from .core import Connection, WebsocketsConnection, peers, queue_presence
+from .event_schemas import export_schemas_json
 
-# peer_id -> {ws, last_seen, meta}
-peers: Dict[str, dict] = {}
 # agent_id -> {process, peer_id, config}
 agents: Dict[str, dict] = {}
+# listening servers, handed-off and upgrade-in-progress flags, loaded config
+relay_state: dict = {"servers": [], "handed_off": False, "upgrading": False, "config": {}}
 
-STALE_TIMEOUT = 30
 CONFIG_FILE = Path.home() / ".config" / "ag-mesh-relay" / "config.json"
-VALIDATE_EVENTS = os.getenv("VALIDATE_EVENTS", "true").lower() == "true"
+# Seconds between background scans for kiro-cli sessions started outside the relay
+DISCOVERY_INTERVAL = 30
+# Seconds a relaunched agent must stay up before buffered commands are written to it
+AGENT_START_GRACE = 0.5
+# Seconds a stopping agent gets to exit after SIGTERM
+AGENT_STOP_TIMEOUT = 5
+# Seconds between load polls of sibling relays, and how long one poll may take
+SIBLING_POLL_INTERVAL = 15
+SIBLING_POLL_TIMEOUT = 5
 
 
 def load_config() -> dict:
@@ -33,57 +44,16 @@ def load_config() -> dict:
     default_config = {"agents": [], "server": {"host": "localhost", "port": 10000}}
     CONFIG_FILE.parent.mkdir(parents=True, exist_ok=True)
     CONFIG_FILE.write_text(json.dumps(default_config, indent=2))
-    print(f"Created default config at {CONFIG_FILE}")
+    log.info("relay", f"Created default config at {CONFIG_FILE}")
     return default_config
 
 
-async def broadcast(msg: dict, *, exclude: Optional[str] = None):
-    """Broadcast message to all connected peers except excluded one."""
-    # Validate event if enabled
-    if VALIDATE_EVENTS and "type" in msg:
-        is_valid, errors = validate_event(msg["type"], msg.get("data", {}))
-        if not is_valid:
-            print(f"[Relay] Invalid event {msg['type']}: {errors}")
-    
-    raw = json.dumps(msg)
-    gone = []
-    for pid, p in peers.items():
-        if pid == exclude:
-            continue
-        try:
-            await p["ws"].send(raw)
-        except Exception:
-            gone.append(pid)
-    for pid in gone:
-        peers.pop(pid, None)
-
-
-async def reap_stale():
-    """Remove stale peers that haven't sent heartbeat."""
-    while True:
-        await asyncio.sleep(10)
-        now = time.time()
-        stale = [pid for pid, p in peers.items() if now - p["last_seen"] > STALE_TIMEOUT]
-        for pid in stale:
-            p = peers.pop(pid, None)
-            if p:
-                try:
-                    await p["ws"].close()
-                except Exception:
-                    pass
-                await broadcast({
-                    "type": "presence",
-                    "from": pid,
-                    "data": {"status": "offline"},
-                    "timestamp": time.time()
-                })
-
-
 async def discover_kiro_agents() -> list[dict]:
     """Discover running kiro-cli ACP sessions on the system."""
     try:
         # Use ps to find kiro-cli acp processes
-        result = subprocess.run(
+        result = await asyncio.to_thread(
+            subprocess.run,
             ["ps", "aux"],
             capture_output=True,
             text=True,
@@ -120,17 +90,96 @@ async def discover_kiro_agents() -> list[dict]:
         
         return discovered
     except Exception as e:
-        print(f"[Relay] Error discovering kiro agents: {e}")
+        log.error("agents", f"Error discovering kiro agents: {e}")
         return []
 
 
+def sync_agents():
+    """Bring the capability index and task dispatcher in line with configured and managed agents."""
+    for agent_config in relay_state["config"].get("agents", []):
+        if agent_config.get("id") and agent_config["id"] not in agents:
+            capability_index.set_instance(
+                agent_config["id"], "kiro-cli", agent=agent_config.get("agent", "default"),
+                status="configured", source="config", peerId=f"kiro-{agent_config['id']}"
+            )
+    loads = dispatcher.summary()["agents"]
+    for agent_id, agent in agents.items():
+        alive = agent["process"] is not None and agent["process"].poll() is None
+        if alive:
+            status = agent.get("state", "running")
+        elif agent["process"] is None:
+            status = "stopped"  # hibernated; the next command relaunches it
+        else:
+            status = "exited"  # not reaped yet
+        slot = loads.get(agent_id)
+        capability_index.set_instance(
+            agent_id, "kiro-cli", agent=agent["config"].get("agent", "default"),
+            status=status, source="managed", peerId=agent["peer_id"],
+            tasks=slot["inFlight"] + slot["queued"] if slot else 0
+        )
+        # Hibernating agents still take tasks; the first one wakes them
+        if alive or agent.get("state") == "stopped":
+            dispatcher.register_agent(
+                agent_id, agent["config"].get("agent", "default"),
+                agent["config"].get("maxConcurrentTasks", dispatcher.DEFAULT_CONCURRENCY),
+                agent["config"].get("taskTimeout", dispatcher.TASK_TIMEOUT)
+            )
+
+
+async def refresh_discovered():
+    """Index kiro-cli sessions not managed by this relay."""
+    managed = {str(agent["process"].pid) for agent in agents.values() if agent["process"] is not None}
+    discovered = [a for a in await discover_kiro_agents() if a["pid"] not in managed]
+    capability_index.replace_discovered(discovered)
+    return discovered
+
+
+async def watch_discovered():
+    """Keep discovered agents fresh so find_agents never waits on ps."""
+    while True:
+        await refresh_discovered()
+        await asyncio.sleep(DISCOVERY_INTERVAL)
+
+
+async def poll_sibling(url: str) -> Optional[dict]:
+    """Ask a sibling relay for its load summary; None when it can't be reached."""
+    try:
+        async with websockets.connect(url, open_timeout=SIBLING_POLL_TIMEOUT) as ws:
+            await ws.send(json.dumps({"type": "load"}))
+            while True:
+                msg = json.loads(await asyncio.wait_for(ws.recv(), SIBLING_POLL_TIMEOUT))
+                if msg.get("type") == "load_response":
+                    return msg.get("data")
+                if msg.get("type") == "redirect":
+                    # Overloaded itself; the redirect carries its load
+                    return msg.get("data", {}).get("load")
+    except Exception as e:
+        log.debug("relay", f"Sibling {url} unreachable: {e}")
+        return None
+
+
+async def watch_siblings():
+    """Keep sibling loads fresh so redirects go to the least-loaded one."""
+    while True:
+        urls = load.sibling_urls()
+        results = await asyncio.gather(*(poll_sibling(url) for url in urls))
+        for url, summary in zip(urls, results):
+            load.report_sibling(url, summary)
+        await asyncio.sleep(SIBLING_POLL_INTERVAL)
+
+
+def agent_cwd(config: dict) -> Path:
+    """The agent's absolute working directory."""
+    return Path(config.get("workingPath", "~/src")).expanduser().absolute()
+
+
 async def launch_kiro_agent(agent_id: str, config: dict) -> Optional[subprocess.Popen]:
     """Launch a kiro-cli acp session."""
-    working_path = Path(config.get("workingPath", "~/src")).expanduser()
+    working_path = agent_cwd(config)
     agent_name = config.get("agent", "default")
     
     if not working_path.exists():
-        print(f"Working path does not exist: {working_path}")
+        log.error("agents", f"Working path does not exist: {working_path}")
         return None
     
     cmd = ["kiro-cli", "acp", "--agent", agent_name, "--cwd", str(working_path)]
@@ -144,24 +193,39 @@ async def launch_kiro_agent(agent_id: str, config: dict) -> Optional[subprocess.
             text=True,
             bufsize=1
         )
-        print(f"Launched kiro-cli agent {agent_id}: {' '.join(cmd)}")
+        log.info("agents", f"Launched kiro-cli agent {agent_id}: {' '.join(cmd)}")
         return proc
     except Exception as e:
-        print(f"Failed to launch agent {agent_id}: {e}")
+        log.error("agents", f"Failed to launch agent {agent_id}: {e}")
         return None
 
 
-async def handle_agent_command(agent_id: str, command: dict):
-    """Send command to kiro-cli agent and relay response."""
+async def ready_agent(agent_id: str) -> Optional[str]:
+    """Wake the agent if it is hibernating and mark it active. Returns an error message on failure."""
     if agent_id not in agents:
-        return {"error": f"Agent {agent_id} not found"}
-    
+        return f"Agent {agent_id} not found"
+
     agent = agents[agent_id]
-    proc = agent["process"]
-    
-    if proc.poll() is not None:
-        return {"error": f"Agent {agent_id} process terminated"}
-    
+    agent["last_active"] = time.time()
+    if agent.get("state", "running") != "running" or agent.get("waking"):
+        error = await wake_agent(agent_id)
+        if error:
+            return error
+
+    if agent["process"].poll() is not None:
+        return f"Agent {agent_id} process terminated"
+
+    if agent_id in capability_index.instances:
+        capability_index.instances[agent_id]["lastCommand"] = time.time()
+    return None
+
+
+async def handle_agent_command(agent_id: str, command: dict):
+    """Send command to kiro-cli agent and relay response."""
+    error = await ready_agent(agent_id)
+    if error:
+        return {"error": error}
+    proc = agents[agent_id]["process"]
     try:
         # Send command to kiro-cli stdin
         cmd_json = json.dumps(command) + "\n"
@@ -175,241 +239,295 @@ async def handle_agent_command(agent_id: str, command: dict):
         return {"error": str(e)}
 
 
-async def handle_message(ws: WebSocketServerProtocol, msg: dict, peer_id: Optional[str]):
-    """Handle incoming WebSocket message."""
+def idle_policy(agent_id: str, config: dict) -> Optional[dict]:
+    """The agent's {after, action} idle policy, if it has a valid one."""
+    policy = config.get("idle")
+    if not policy:
+        return None
+    try:
+        after = float(policy["after"])
+        action = policy.get("action", "suspend")
+    except (TypeError, KeyError, ValueError, AttributeError):
+        after, action = -1, None
+    if after == 0:
+        return None
+    if not after > 0 or action not in ("suspend", "stop"):
+        log.warn("agents", f"Ignoring invalid idle policy for agent {agent_id}: {policy!r}")
+        return None
+    if action == "suspend" and not hasattr(signal, "SIGSTOP"):
+        action = "stop"  # no job control (Windows)
+    return {"after": after, "action": action}
+
+
+def announce_agent(agent_id: str, status: str):
+    """Show an agent's hibernation state in its presence."""
+    agent = agents[agent_id]
+    queue_presence({
+        "type": "presence",
+        "from": agent["peer_id"],
+        "data": {"status": status, "type": "kiro-cli", "agent": agent["config"].get("agent", "default")},
+        "timestamp": time.time()
+    })
+
+
+def close_pipes(proc):
+    for pipe in (proc.stdin, proc.stdout, proc.stderr):
+        if pipe:
+            try:
+                pipe.close()
+            except OSError:
+                pass
+
+
+async def hibernate_agent(agent_id: str, action: str):
+    """Suspend (SIGSTOP) or stop an idle agent, keeping its peer identity and config."""
+    agent = agents[agent_id]
+    proc = agent["process"]
+    status = "idle" if action == "suspend" else "stopped"
+    if action == "suspend":
+        proc.send_signal(signal.SIGSTOP)
+        agent["state"] = status
+    else:
+        # Detach first so the reaper doesn't take the exit for a crash
+        agent.update(process=None, state=status)
+        acp.detach(agent_id)
+        proc.terminate()
+        try:
+            await asyncio.to_thread(proc.wait, AGENT_STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            await asyncio.to_thread(proc.wait)
+        close_pipes(proc)
+        if agents.get(agent_id) is not agent or agent["state"] != status:
+            return  # woken by a command while it stopped; the wake-up announced it
+    announce_agent(agent_id, status)
+    sync_agents()
+    log.info("agents", f"Agent {agent_id} idle, {'suspended' if action == 'suspend' else 'stopped'}")
+
+
+async def wake_agent(agent_id: str) -> Optional[str]:
+    """Resume or relaunch a hibernating agent. Returns an error message on failure.
+
+    Commands arriving while an agent wakes wait on the same wake-up and are
+    then written in the order they arrived.
+    """
+    agent = agents[agent_id]
+    if agent.get("waking") is None:
+        agent["waking"] = asyncio.ensure_future(_wake(agent_id))
+    waking = agent["waking"]
+    try:
+        return await asyncio.shield(waking)
+    finally:
+        if agent.get("waking") is waking and waking.done():
+            agent["waking"] = None
+
+
+async def _wake(agent_id: str) -> Optional[str]:
+    agent = agents[agent_id]
+    if agent["state"] == "idle":
+        agent["process"].send_signal(signal.SIGCONT)
+    else:
+        proc = await launch_kiro_agent(agent_id, agent["config"])
+        if proc is None:
+            return f"Agent {agent_id} could not be relaunched"
+        agent["process"] = proc
+        await asyncio.sleep(AGENT_START_GRACE)
+        if proc.poll() is not None:
+            # Leave it to the reaper, which reports and forgets exited agents
+            return f"Agent {agent_id} exited while starting"
+    agent.update(state="running", last_active=time.time())
+    announce_agent(agent_id, "online")
+    sync_agents()
+    log.info("agents", f"Agent {agent_id} resumed")
+    return None
+
+
+async def hibernate_idle():
+    """Apply idle policies to agents that have had no commands or tasks for long enough."""
+    now = time.time()
+    for agent_id, agent in list(agents.items()):
+        if "idle_policy" not in agent:
+            # Checked once per agent, so a bad policy is reported once
+            agent["idle_policy"] = idle_policy(agent_id, agent["config"])
+        policy = agent["idle_policy"]
+        if not policy or agent.get("state", "running") != "running" or agent.get("waking"):
+            continue
+        if agent["process"] is None or agent["process"].poll() is not None:
+            continue
+        if dispatcher.slots.get(agent_id, {}).get("inFlight"):
+            continue
+        if now - agent.get("last_active", now) >= policy["after"]:
+            await hibernate_agent(agent_id, policy["action"])
+
+
+async def announce_task(task_id: str, status: str, previous: str, reason: str, agent_id: Optional[str] = None):
+    """Broadcast a dispatcher status transition."""
+    data = {"id": task_id, "status": status, "previousStatus": previous, "changedBy": "relay", "reason": reason}
+    if agent_id:
+        data["assignedTo"] = agents[agent_id]["peer_id"] if agent_id in agents else agent_id
+    await core.broadcast({"type": "task-status-changed", "from": "relay", "data": data, "timestamp": time.time()})
+
+
+async def pump_tasks():
+    """Place waiting tasks and send queued ones to agents with free slots."""
+    if relay_state["upgrading"]:
+        return  # the successor relay is taking over the agents' stdin
+    for task_id, agent_id in dispatcher.assign_unassigned():
+        await announce_task(task_id, "pending", "pending", f"Queued for {agent_id}", agent_id)
+    for agent_id in list(dispatcher.slots):
+        for task in dispatcher.start_ready(agent_id):
+            error = await ready_agent(agent_id)
+            if error:
+                dispatcher.finish(task["id"], "failed")
+                await announce_task(task["id"], "failed", "in-progress", error, agent_id)
+                continue
+            # Each task gets its own ACP session; handle_session_new sends the prompt
+            acp.request(agent_id, agents[agent_id]["process"], "session/new",
+                        {"cwd": str(agent_cwd(agents[agent_id]["config"])), "mcpServers": []},
+                        {"task": task["id"]})
+            await announce_task(task["id"], "in-progress", "pending", f"Started on {agent_id}", agent_id)
+
+
+def task_prompt(task: dict) -> str:
+    return "\n\n".join(part for part in (task.get("title"), task.get("description")) if part)
+
+
+async def settle_task(task_id: str, agent_id: str, status: str, reason: str):
+    """Close a dispatched task with the outcome its agent reported."""
+    if dispatcher.finish(task_id, status) is None:
+        return
+    if agent_id in agents:
+        agents[agent_id]["last_active"] = time.time()
+    await announce_task(task_id, status, "in-progress", reason, agent_id)
+    await pump_tasks()
+
+
+def task_for(agent_id: str, context: dict) -> Optional[dict]:
+    """The dispatcher entry an ACP reply is about, unless the task was settled or moved meanwhile."""
+    in_flight = dispatcher.slots.get(agent_id, {}).get("inFlight", ())
+    return dispatcher.tasks[context["task"]] if context.get("task") in in_flight else None
+
+
+async def handle_session_new(agent_id: str, context: dict, result: Optional[dict], error: Optional[dict]):
+    entry = task_for(agent_id, context)
+    if entry is None:
+        return
+    if error or not (result or {}).get("sessionId"):
+        message = (error or {}).get("message", "no session id")
+        await settle_task(context["task"], agent_id, "failed", f"Agent {agent_id} could not open a session: {message}")
+        return
+    entry["session"] = result["sessionId"]
+    if entry.get("cancelled"):
+        await settle_task(context["task"], agent_id, "failed", timeout_reason(agent_id))
+        return
+    acp.request(agent_id, agents[agent_id]["process"], "session/prompt",
+                {"sessionId": entry["session"], "prompt": [{"type": "text", "text": task_prompt(entry["task"])}]},
+                context)
+
+
+async def handle_prompt_done(agent_id: str, context: dict, result: Optional[dict], error: Optional[dict]):
+    entry = task_for(agent_id, context)
+    if entry is None:
+        return
+    stop_reason = (result or {}).get("stopReason")
+    if error:
+        await settle_task(context["task"], agent_id, "failed", f"Agent {agent_id} failed: {error.get('message')}")
+    elif stop_reason == "end_turn":
+        await settle_task(context["task"], agent_id, "complete", f"Finished on {agent_id}")
+    elif entry.get("cancelled"):
+        await settle_task(context["task"], agent_id, "failed", timeout_reason(agent_id))
+    else:
+        await settle_task(context["task"], agent_id, "failed", f"Agent {agent_id} stopped: {stop_reason}")
+
+
+def timeout_reason(agent_id: str) -> str:
+    slot = dispatcher.slots.get(agent_id)
+    return f"Timed out after {slot['timeout']:g}s on {agent_id}" if slot else f"Timed out on {agent_id}"
+
+
+async def expire_tasks():
+    """Cancel tasks that outlived their agent's taskTimeout; the agent's reply settles them."""
+    for task_id, agent_id in dispatcher.expire():
+        session = dispatcher.tasks[task_id].get("session")
+        log.warn("agents", f"Task {task_id} timed out on {agent_id}, cancelling")
+        if session:
+            acp.notify(agent_id, "session/cancel", {"sessionId": session})
+
+
+async def handle_task_event(conn: Connection, msg: dict):
+    """Dispatch unassigned tasks to managed agents; core has already relayed the event."""
+    data = msg.get("data", {})
+    if not data.get("id"):
+        return
+
+    if msg["type"] == "task-created":
+        if data.get("assignedTo"):
+            return
+        agent_id, dropped = dispatcher.submit(data)
+        for task_id in dropped:
+            await announce_task(task_id, "failed", "pending", "No compatible agent became available")
+        if agent_id:
+            await announce_task(data["id"], "pending", "pending", f"Queued for {agent_id}", agent_id)
+        else:
+            await announce_task(data["id"], "pending", "pending", "Waiting for a compatible agent")
+    else:
+        entry = dispatcher.tasks.get(data["id"])
+        agent_id = dispatcher.finish(data["id"], data.get("status"))
+        if agent_id is None:
+            return
+        if entry.get("session"):
+            # Settled by a peer: stop the agent working on it
+            acp.notify(agent_id, "session/cancel", {"sessionId": entry["session"]})
+    await pump_tasks()
+
+
+async def handle_message(conn: Connection, msg: dict):
+    """Handle relay requests specific to the local relay; routing lives in core."""
     mtype = msg.get("type")
     
     if mtype == "get_schemas":
         # Return event schemas
-        await ws.send(json.dumps({
+        await conn.send(json.dumps({
             "type": "schemas_response",
             "data": export_schemas_json()
         }))
-        return peer_id
+        return
     
     if mtype == "capabilities":
         # Respond with relay capabilities using AgentCard format
-        agent_cards = []
-        
-        # Add kiro-cli agent card
-        agent_cards.append({
-            "name": "kiro-cli",
-            "description": "AWS Kiro CLI - Agentic AI development with spec-driven workflows, custom agents, and MCP integration",
-            "url": "https://kiro.dev/cli/",
-            "provider": {
-                "organization": "AWS",
-                "url": "https://kiro.dev"
-            },
-            "version": "1.0.0",
-            "capabilities": {
-                "streaming": True,
-                "pushNotifications": False,
-                "stateTransitionHistory": False
-            },
-            "authentication": {
-                "schemes": ["None"],
-                "credentials": None
-            },
-            "defaultInputModes": ["text/plain", "application/json", "image/png", "image/jpeg"],
-            "defaultOutputModes": ["text/plain", "application/json", "text/markdown"],
-            "skills": [
-                {
-                    "id": "spec-driven-development",
-                    "name": "Spec-Driven Development",
-                    "description": "Convert natural language to structured requirements (EARS notation), architectural designs, and implementation plans",
-                    "tags": ["specs", "requirements", "architecture", "planning"],
-                    "examples": ["Create spec for user authentication", "Design API architecture", "Generate implementation plan"]
-                },
-                {
-                    "id": "file-operations",
-                    "name": "File Operations",
-                    "description": "Read, write, search files and directories with intelligent context management",
-                    "tags": ["filesystem", "io", "search", "code-intelligence"],
-                    "examples": ["Read package.json", "Search for TODO comments", "Find all references to function"]
-                },
-                {
-                    "id": "code-execution",
-                    "name": "Code Execution",
-                    "description": "Execute bash commands, run tests, manage git workflows",
-                    "tags": ["bash", "shell", "execution", "git", "testing"],
-                    "examples": ["Run npm install", "Execute test suite", "Create git commit"]
-                },
-                {
-                    "id": "aws-operations",
-                    "name": "AWS Operations",
-                    "description": "Interact with AWS services via CLI and SDKs",
-                    "tags": ["aws", "cloud", "infrastructure", "deployment"],
-                    "examples": ["List S3 buckets", "Deploy CloudFormation stack", "Query DynamoDB"]
-                },
-                {
-                    "id": "custom-agents",
-                    "name": "Custom Agents",
-                    "description": "Create task-specific agents with pre-defined permissions, context, and prompts",
-                    "tags": ["agents", "automation", "workflows"],
-                    "examples": ["Create testing agent", "Build deployment agent", "Configure code review agent"]
-                },
-                {
-                    "id": "mcp-integration",
-                    "name": "MCP Integration",
-                    "description": "Connect to external tools and services via Model Context Protocol",
-                    "tags": ["mcp", "integration", "tools", "apis"],
-                    "examples": ["Connect to database", "Integrate with Slack", "Access documentation"]
-                },
-                {
-                    "id": "agent-hooks",
-                    "name": "Agent Hooks",
-                    "description": "Automate workflows with event-triggered agents (file save, pre-commit, etc.)",
-                    "tags": ["hooks", "automation", "events"],
-                    "examples": ["Auto-generate docs on save", "Run tests pre-commit", "Format code on save"]
-                },
-                {
-                    "id": "steering",
-                    "name": "Agent Steering",
-                    "description": "Configure agent behavior with project-specific rules, conventions, and best practices",
-                    "tags": ["steering", "configuration", "standards"],
-                    "examples": ["Set coding standards", "Define project conventions", "Configure workflows"]
-                }
-            ]
-        })
-        
-        # Add Claude Code agent card
-        agent_cards.append({
-            "name": "claude-code",
-            "description": "Anthropic Claude Code - Agentic coding assistant with autonomous workflows, subagents, and checkpoints",
-            "url": "https://code.claude.com",
-            "provider": {
-                "organization": "Anthropic",
-                "url": "https://anthropic.com"
-            },
-            "version": "2.0.0",
-            "capabilities": {
-                "streaming": True,
-                "pushNotifications": False,
-                "stateTransitionHistory": True
-            },
-            "authentication": {
-                "schemes": ["Bearer"],
-                "credentials": None
-            },
-            "defaultInputModes": ["text/plain", "application/json", "image/png", "image/jpeg"],
-            "defaultOutputModes": ["text/plain", "application/json", "text/markdown"],
-            "skills": [
-                {
-                    "id": "agentic-loop",
-                    "name": "Agentic Loop",
-                    "description": "Autonomous gather-act-verify loop with adaptive planning and course correction",
-                    "tags": ["autonomous", "planning", "reasoning"],
-                    "examples": ["Fix failing tests", "Refactor authentication", "Debug production issue"]
-                },
-                {
-                    "id": "file-operations",
-                    "name": "File Operations",
-                    "description": "Read, edit, create, rename files with multi-file coordination",
-                    "tags": ["filesystem", "editing", "refactor"],
-                    "examples": ["Refactor across multiple files", "Reorganize project structure", "Update imports"]
-                },
-                {
-                    "id": "code-search",
-                    "name": "Code Search",
-                    "description": "Find files by pattern, search content with regex, explore codebases",
-                    "tags": ["search", "navigation", "discovery"],
-                    "examples": ["Find all API endpoints", "Search for security issues", "Locate configuration"]
-                },
-                {
-                    "id": "execution",
-                    "name": "Execution",
-                    "description": "Run shell commands, start servers, run tests, use git",
-                    "tags": ["bash", "shell", "git", "testing"],
-                    "examples": ["Run test suite", "Start dev server", "Create PR"]
-                },
-                {
-                    "id": "web-research",
-                    "name": "Web Research",
-                    "description": "Search the web, fetch documentation, look up error messages",
-                    "tags": ["web", "research", "documentation"],
-                    "examples": ["Look up API docs", "Research error message", "Find best practices"]
-                },
-                {
-                    "id": "code-intelligence",
-                    "name": "Code Intelligence",
-                    "description": "Type checking, jump to definitions, find references with LSP integration",
-                    "tags": ["lsp", "types", "navigation"],
-                    "examples": ["Check type errors", "Find all usages", "Go to definition"]
-                },
-                {
-                    "id": "subagents",
-                    "name": "Subagents",
-                    "description": "Spawn specialized sub-agents for parallel tasks with isolated context",
-                    "tags": ["subagents", "parallel", "delegation"],
-                    "examples": ["Delegate testing to subagent", "Parallel feature development", "Background research"]
-                },
-                {
-                    "id": "checkpoints",
-                    "name": "Checkpoints",
-                    "description": "Snapshot and rewind file changes with undo/redo capabilities",
-                    "tags": ["safety", "undo", "versioning"],
-                    "examples": ["Rewind failed refactor", "Try different approach", "Undo changes"]
-                },
-                {
-                    "id": "skills",
-                    "name": "Skills",
-                    "description": "Reusable workflows loaded on-demand to manage context",
-                    "tags": ["skills", "workflows", "reusable"],
-                    "examples": ["Load testing workflow", "Apply code review checklist", "Run deployment steps"]
-                },
-                {
-                    "id": "mcp-integration",
-                    "name": "MCP Integration",
-                    "description": "Connect to external services via Model Context Protocol",
-                    "tags": ["mcp", "integration", "tools"],
-                    "examples": ["Connect to database", "Access APIs", "Integrate services"]
-                }
-            ]
-        })
+        agent_cards = list(AGENT_CARDS)
         
         # Discover running kiro-cli agents
-        discovered = await discover_kiro_agents()
+        discovered = [dict(a, card="kiro-cli") for a in await refresh_discovered()]
         all_agents = list(agents.keys()) + [a["id"] for a in discovered]
         
-        await ws.send(json.dumps({
+        await conn.send(json.dumps({
             "type": "capabilities_response",
             "data": {
                 "agentCards": agent_cards,
                 "activeAgents": all_agents,
-                "discoveredAgents": discovered
+                "discoveredAgents": discovered,
+                "load": core.load_summary()
             }
         }))
-        return peer_id
-    
-    elif mtype == "presence":
-        new_peer_id = msg["from"]
-        peers[new_peer_id] = {
-            "ws": ws,
-            "last_seen": time.time(),
-            "meta": msg.get("data", {})
-        }
-        
-        # Send existing peers to newcomer
-        for pid, p in peers.items():
-            if pid != new_peer_id:
-                await ws.send(json.dumps({
-                    "type": "presence",
-                    "from": pid,
-                    "data": p["meta"],
-                    "timestamp": p["last_seen"]
-                }))
-        
-        await broadcast(msg, exclude=new_peer_id)
-        return new_peer_id
-    
-    elif mtype == "heartbeat":
-        if peer_id and peer_id in peers:
-            peers[peer_id]["last_seen"] = time.time()
     
-    elif mtype == "direct":
-        target = msg.get("to")
-        if target and target in peers:
-            await peers[target]["ws"].send(json.dumps(msg))
+    elif mtype == "find_agents":
+        # Indexed lookup by skill, tag, mode and availability
+        query = msg.get("data", {})
+        error = capability_index.check_query(query)
+        if error:
+            await conn.send(json.dumps({
+                "type": "error",
+                "requestId": msg.get("requestId"),
+                "data": {"message": error}
+            }))
+            return
+        sync_agents()
+        await conn.send(json.dumps({
+            "type": "find_agents_response",
+            "requestId": msg.get("requestId"),
+            "data": capability_index.find(query)
+        }))
     
     elif mtype == "launch_agent":
         # Custom command to launch kiro-cli agent
@@ -417,22 +535,25 @@ async def handle_message(ws: WebSocketServerProtocol, msg: dict, peer_id: Option
         config = msg.get("config", {})
         
         if agent_id in agents:
-            await ws.send(json.dumps({
+            await conn.send(json.dumps({
                 "type": "error",
                 "data": {"message": f"Agent {agent_id} already exists"}
             }))
-            return peer_id
+            return
         
         proc = await launch_kiro_agent(agent_id, config)
         if proc:
             agents[agent_id] = {
                 "process": proc,
                 "peer_id": f"kiro-{agent_id}",
-                "config": config
+                "config": config,
+                "state": "running",
+                "last_active": time.time()
             }
+            sync_agents()
             
             # Announce agent as new peer
-            await broadcast({
+            queue_presence({
                 "type": "presence",
                 "from": f"kiro-{agent_id}",
                 "data": {
@@ -443,48 +564,36 @@ async def handle_message(ws: WebSocketServerProtocol, msg: dict, peer_id: Option
                 "timestamp": time.time()
             })
             
-            await ws.send(json.dumps({
+            await conn.send(json.dumps({
                 "type": "agent_launched",
                 "agentId": agent_id,
                 "peerId": f"kiro-{agent_id}"
             }))
+            await pump_tasks()
     
     elif mtype == "agent_command":
         # Relay command to kiro-cli agent
         agent_id = msg.get("agentId")
         command = msg.get("command", {})
         result = await handle_agent_command(agent_id, command)
-        await ws.send(json.dumps({
+        await conn.send(json.dumps({
             "type": "agent_response",
             "agentId": agent_id,
             "data": result
         }))
-    
-    else:
-        # broadcast, stream, ack, turn_end, error
-        await broadcast(msg, exclude=peer_id)
-    
-    return peer_id
 
 
-async def handler(ws: WebSocketServerProtocol):
+core.handlers.update(dict.fromkeys(
+    ["get_schemas", "capabilities", "find_agents", "launch_agent", "agent_command"], handle_message
+))
+core.observers.update(dict.fromkeys(["task-created", "task-status-changed"], handle_task_event))
+acp.handlers.update({"session/new": handle_session_new, "session/prompt": handle_prompt_done})
+
+
+async def handler(ws):
     """WebSocket connection handler."""
-    peer_id = None
-    try:
-        async for raw in ws:
-            msg = json.loads(raw)
-            peer_id = await handle_message(ws, msg, peer_id)
-    except Exception as e:
-        print(f"Connection error: {e}")
-    finally:
-        if peer_id:
-            peers.pop(peer_id, None)
-            await broadcast({
-                "type": "presence",
-                "from": peer_id,
-                "data": {"status": "offline"},
-                "timestamp": time.time()
-            })
+    admission.handshake_done()
+    await core.serve(WebsocketsConnection(ws))
 
 
 async def start_autostart_agents(config: dict):
@@ -492,26 +601,79 @@ async def start_autostart_agents(config: dict):
     for agent_config in config.get("agents", []):
         if agent_config.get("autoStart", False):
             agent_id = agent_config["id"]
+            if agent_id in agents:
+                continue
             proc = await launch_kiro_agent(agent_id, agent_config)
             if proc:
                 agents[agent_id] = {
                     "process": proc,
                     "peer_id": f"kiro-{agent_id}",
-                    "config": agent_config
+                    "config": agent_config,
+                    "state": "running",
+                    "last_active": time.time()
                 }
 
 
+async def reap_agents():
+    """Forget agents whose process has exited and announce them offline."""
+    exited = [
+        a for a, agent in agents.items()
+        if agent["process"] is not None and agent["process"].poll() is not None and not agent.get("waking")
+    ]
+    for agent_id in exited:
+        agent = agents.pop(agent_id)
+        proc = agent["process"]
+        acp.detach(agent_id)
+        close_pipes(proc)
+        if isinstance(proc, subprocess.Popen):
+            proc.wait()  # collect the exit status so no zombie is left behind
+        capability_index.remove_instance(agent_id)
+        queue_presence(core.offline_frame(agent["peer_id"]))
+        log.info("agents", f"Agent {agent_id} exited with status {proc.returncode}")
+        await release_tasks(agent_id)
+    sync_agents()
+    await pump_tasks()
+
+
+async def release_tasks(agent_id: str):
+    """Fail the tasks a gone agent was running and requeue the ones waiting on it."""
+    lost, requeued = dispatcher.remove_agent(agent_id)
+    for task_id in lost:
+        await announce_task(task_id, "failed", "in-progress", f"Agent {agent_id} exited")
+    for task_id in requeued:
+        await announce_task(task_id, "pending", "pending", f"Agent {agent_id} exited, waiting for another agent")
+
+
+async def watch_agents():
+    """Periodically reap exited agents, time out stuck tasks and hibernate idle ones."""
+    while True:
+        await asyncio.sleep(core.REAP_INTERVAL)
+        if relay_state["upgrading"]:
+            continue  # the successor relay manages the agents from here on
+        try:
+            await reap_agents()
+            await expire_tasks()
+            await hibernate_idle()
+        except Exception as e:
+            log.error("agents", f"Agent maintenance failed: {e}")
+
+
 async def cleanup_agents():
     """Cleanup agent processes on shutdown."""
+    if relay_state["handed_off"]:
+        log.info("agents", f"Left {len(agents)} agents running for the successor relay")
+        return
     for agent_id, agent in agents.items():
         proc = agent["process"]
-        if proc.poll() is None:
+        if proc is not None and proc.poll() is None:
+            if agent.get("state") == "idle":
+                proc.send_signal(signal.SIGCONT)  # a stopped process won't act on SIGTERM
             proc.terminate()
             try:
                 proc.wait(timeout=5)
             except subprocess.TimeoutExpired:
                 proc.kill()
-        print(f"Cleaned up agent {agent_id}")
+        log.info("agents", f"Cleaned up agent {agent_id}")
 
 
 async def find_available_port(start_port: int = 10000, max_port: int = 10100) -> Optional[int]:
@@ -527,32 +689,127 @@ async def find_available_port(start_port: int = 10000, max_port: int = 10100) ->
     return None
 
 
+async def drain(reason: str):
+    """Stop accepting connections and ask peers to reconnect with spread-out delays."""
+    for server in relay_state["servers"]:
+        # Close the listening socket only; established connections stay up
+        server.server.close()
+    await core.drain(reason)
+
+
+async def upgrade(stop: asyncio.Future):
+    """Hand sockets, peers and agents to a new relay process, then drain."""
+    # A second SIGUSR2 while the successor starts must not spawn another one
+    if relay_state["upgrading"] or core.relay_state["draining"]:
+        return
+    relay_state["upgrading"] = True
+    sockets = [sock for server in relay_state["servers"] for sock in server.sockets]
+    # Replies to pending ACP requests are read by the successor from here on
+    acp.pause()
+    try:
+        proc, ready_fd = handoff.spawn_successor(
+            sockets, peers, agents, mailbox.snapshot(), dispatcher.snapshot(), acp.snapshot()
+        )
+    except Exception as e:
+        log.error("relay", f"Could not start successor relay: {e}")
+        await resume_after_failed_upgrade()
+        return
+    log.info("relay", f"Started successor relay pid {proc.pid}, waiting for it to accept connections")
+
+    if not await handoff.wait_ready(ready_fd):
+        log.error("relay", "Successor relay did not become ready, continuing to serve")
+        if proc.poll() is None:
+            proc.terminate()
+        await resume_after_failed_upgrade()
+        return
+
+    relay_state["handed_off"] = True
+    await drain("restart")
+    if not stop.done():
+        stop.set_result("restart")
+
+
+async def resume_after_failed_upgrade():
+    relay_state["upgrading"] = False
+    acp.resume()
+    await pump_tasks()
+
+
 async def start_server():
     """Start local WebSocket server."""
     config = load_config()
+    snapshot = handoff.load_handoff()
+    capture.start_capture()
     
-    asyncio.create_task(reap_stale())
+    core.ensure_reaper()
+    if snapshot:
+        # Peers keep their directory entries until they reconnect or go stale
+        for pid, p in snapshot.get("peers", {}).items():
+            peers[pid] = {"conn": None, "last_seen": p["last_seen"], "meta": p["meta"]}
+        agents.update(handoff.adopt_agents(snapshot))
+        mailbox.restore(snapshot.get("mailboxes", {}))
+        dispatcher.restore(snapshot.get("tasks", {}))
+        acp.restore(snapshot.get("acp", {}), {a: agent["process"] for a, agent in agents.items()})
+        for agent_id in [a for a in dispatcher.slots if a not in agents]:
+            await release_tasks(agent_id)  # exited during the handoff
     await start_autostart_agents(config)
+    relay_state["config"] = config
+    sync_agents()
     
     server_config = config.get("server", {})
+    load.configure(server_config)
     host = os.getenv("HOST", server_config.get("host", "localhost"))
     
-    # Find available port
-    requested_port = int(os.getenv("PORT", server_config.get("port", 10000)))
-    port = await find_available_port(requested_port, 10100)
-    
-    if port is None:
-        print(f"❌ No available ports in range {requested_port}-10100")
-        return
+    if snapshot:
+        servers = [
+            await websockets.serve(
+                handler, sock=sock, max_size=MAX_FRAME_SIZE, process_request=admission.process_request
+            )
+            for sock in handoff.inherited_sockets(snapshot)
+        ]
+        host, port = servers[0].sockets[0].getsockname()[:2]
+        log.info("relay", f"ag-mesh-relay took over ws://{host}:{port} with {len(peers)} peers, {len(agents)} agents")
+    else:
+        # Find available port
+        requested_port = int(os.getenv("PORT", server_config.get("port", 10000)))
+        port = await find_available_port(requested_port, 10100)
+        
+        if port is None:
+            log.error("relay", f"No available ports in range {requested_port}-10100")
+            return
+        
+        servers = [await websockets.serve(
+            handler, host, port, max_size=MAX_FRAME_SIZE, process_request=admission.process_request
+        )]
+        log.info("relay", f"ag-mesh-relay starting on ws://{host}:{port}")
+    relay_state["servers"] = servers
+    log.info("relay", f"Config: {CONFIG_FILE}")
+    log.info("relay", f"Active agents: {list(agents.keys())}")
     
-    print(f"ag-mesh-relay starting on ws://{host}:{port}")
-    print(f"Config: {CONFIG_FILE}")
-    print(f"Active agents: {list(agents.keys())}")
+    discovery = asyncio.ensure_future(watch_discovered())
+    agent_reaper = asyncio.ensure_future(watch_agents())
+    sibling_poller = asyncio.ensure_future(watch_siblings())
+    loop = asyncio.get_running_loop()
+    stop = loop.create_future()
+    try:
+        # SIGTERM drains and exits; SIGUSR2 hands over to a new process
+        loop.add_signal_handler(signal.SIGTERM, lambda: stop.done() or stop.set_result("shutdown"))
+        loop.add_signal_handler(signal.SIGUSR2, lambda: asyncio.ensure_future(upgrade(stop)))
+    except (NotImplementedError, AttributeError):
+        pass  # no POSIX signals (Windows)
+    if snapshot:
+        handoff.signal_ready(snapshot)
     
     try:
-        async with websockets.serve(handler, host, port):
-            await asyncio.Future()  # run forever
+        if await stop == "shutdown":
+            await drain("shutdown")
     finally:
+        discovery.cancel()
+        agent_reaper.cancel()
+        sibling_poller.cancel()
+        for server in servers:
+            server.close()
+        capture.stop_capture()
         await cleanup_agents()
 
 
@@ -561,7 +818,7 @@ def main():
     try:
         asyncio.run(start_server())
     except KeyboardInterrupt:
-        print("\nShutting down...")
+        log.info("relay", "Shutting down...")
 
 
 if __name__ == "__main__":
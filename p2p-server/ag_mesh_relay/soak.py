@@ -0,0 +1,419 @@
+"""Soak the local relay with days of churn in compressed time and check for leaks.
+
+    python -m ag_mesh_relay.soak --hours 24 --time-scale 720 --peers 20
+
+Starts ag_mesh_relay.server's handler on a loopback port in this process and
+drives it with real websocket clients: peers join, chat, send direct messages
+to peers that may be offline, go quiet without closing (left for the stale
+reaper) or disconnect, while a control client launches kiro-cli agents and
+commands them to exit. Relay timeouts and client timings are divided by
+--time-scale, so --hours of simulated traffic take hours * 3600 / scale seconds.
+
+Every --sample-minutes of simulated time the harness records RSS, heap size
+(tracemalloc), open file descriptors, asyncio task count, the size of every
+relay table, and direct-message latency percentiles from a pair of probe
+peers. After the run all clients leave and the relay is given time to reap;
+the run fails if the quiesced relay holds more memory, descriptors, tasks or
+table entries than at the end of warm-up, or if latency drifted upwards.
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+import websockets
+
+from . import admission, capability_index, chunking, core, mailbox, server, tracing
+from .replay import percentiles
+
+# Simulated seconds between client heartbeats
+HEARTBEAT_INTERVAL = 10
+# Probe messages sent per sample window
+PROBES_PER_SAMPLE = 20
+# Lower bound on the scaled stale-peer timeout, in wall-clock seconds
+MIN_STALE_TIMEOUT = 1.0
+# Wall-clock seconds to wait for connections to finish closing before sampling
+QUIESCE_TIMEOUT = 15
+
+# Stands in for kiro-cli: runs until it reads one command, then exits
+AGENT_SHIM = "#!/bin/sh\nexec head -n 1 >/dev/null\n"
+
+
+def rss_bytes() -> int:
+    """Resident set size of this process."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        # ru_maxrss is a high-water mark, so only growth is meaningful here
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def open_fds() -> int:
+    for path in ("/proc/self/fd", "/dev/fd"):
+        try:
+            return len(os.listdir(path))
+        except OSError:
+            continue
+    return -1
+
+
+def table_sizes() -> Dict[str, int]:
+    """Entries held in each relay table."""
+    return {
+        "peers": len(core.peers),
+        "connections": len(core.connections),
+        "pendingPresence": len(core.pending_presence),
+        "agents": len(server.agents),
+        "mailboxes": len(mailbox.mailboxes),
+        "uploads": len(chunking.uploads),
+        "agentInstances": len(capability_index.instances),
+        "tracedPeers": len(tracing.peer_hops),
+        "probes": len(tracing.probes),
+    }
+
+
+def scale_timeouts(scale: float):
+    """Compress the relay's timers so simulated days fit in minutes."""
+    # Event loop stalls under load are not scaled; don't reap live peers over them
+    core.STALE_TIMEOUT = max(core.STALE_TIMEOUT / scale, MIN_STALE_TIMEOUT)
+    core.REAP_INTERVAL /= scale
+    core.PRESENCE_COALESCE_WINDOW /= scale
+    core.DRAIN_GRACE /= scale
+    mailbox.MAILBOX_TTL /= scale
+    chunking.UPLOAD_IDLE_TIMEOUT /= scale
+    # The harness reconnects far faster than real clients; don't throttle it
+    admission.ACCEPT_RATE = admission.ACCEPT_BURST = 10 ** 6
+    admission._bucket["tokens"] = float(admission.ACCEPT_BURST)
+
+
+class Soak:
+    """Client population, agent churn and sampling for one run."""
+
+    def __init__(self, url: str, args: argparse.Namespace):
+        self.url = url
+        self.args = args
+        self.scale = args.time_scale
+        self.rng = random.Random(args.seed)
+        self.running = True
+        self.next_peer = 0
+        self.next_agent = 0
+        self.stats = {"sessions": 0, "abandoned": 0, "sent": 0, "received": 0, "agentsLaunched": 0, "errors": 0}
+        self.clients: set = set()
+        # agent_response frames for the control connection
+        self.responses: asyncio.Queue = asyncio.Queue()
+
+    def wall(self, simulated_seconds: float) -> float:
+        return simulated_seconds / self.scale
+
+    async def peer_session(self):
+        """One peer connection from join to disconnect (or abandonment)."""
+        peer_id = f"soak-{self.next_peer}"
+        self.next_peer += 1
+        lifetime = self.wall(self.rng.expovariate(1 / (self.args.session_minutes * 60)))
+        abandon = self.rng.random() < self.args.abandon_ratio
+        try:
+            async with websockets.connect(self.url, max_size=None) as ws:
+                self.stats["sessions"] += 1
+                await ws.send(json.dumps({"type": "presence", "from": peer_id,
+                                          "data": {"status": "online", "agents": []}}))
+                reader = asyncio.ensure_future(self.drain_inbound(ws))
+                deadline = time.monotonic() + lifetime
+                # Chance of sending a message in each heartbeat interval
+                send_chance = self.args.rate * HEARTBEAT_INTERVAL / 60
+                while self.running and time.monotonic() < deadline:
+                    await ws.send(json.dumps({"type": "heartbeat", "from": peer_id}))
+                    for _ in range(int(send_chance) + (self.rng.random() < send_chance % 1)):
+                        await ws.send(json.dumps(self.traffic(peer_id)))
+                        self.stats["sent"] += 1
+                    await asyncio.sleep(self.wall(HEARTBEAT_INTERVAL))
+                if abandon and self.running:
+                    # Go silent with the socket open; the stale reaper has to close it
+                    self.stats["abandoned"] += 1
+                    await asyncio.wait([reader], timeout=core.STALE_TIMEOUT * 4)
+                # Keep reading through the close handshake, like a real client
+                await ws.close()
+                await reader
+        except (OSError, websockets.exceptions.WebSocketException):
+            self.stats["errors"] += 1
+
+    def traffic(self, peer_id: str) -> dict:
+        """A broadcast, or a direct message to a peer that may have left."""
+        n = self.stats["sent"]
+        if self.rng.random() < self.args.direct_ratio:
+            to = f"soak-{self.rng.randrange(max(1, self.next_peer))}"
+            return {"type": "direct", "from": peer_id, "to": to, "id": f"{peer_id}-{n}", "data": {"n": n}}
+        return {"type": "stream", "from": peer_id, "data": {"n": n, "text": "x" * self.rng.randrange(16, 512)}}
+
+    async def drain_inbound(self, ws, responses: Optional[asyncio.Queue] = None):
+        try:
+            async for raw in ws:
+                self.stats["received"] += 1
+                if responses is not None and '"agent_response"' in raw:
+                    responses.put_nowait(raw)
+        except websockets.exceptions.WebSocketException:
+            pass
+
+    async def keepalive(self, ws, peer_id: str):
+        """Heartbeat for the harness's own long-lived connections."""
+        try:
+            while True:
+                await ws.send(json.dumps({"type": "heartbeat", "from": peer_id}))
+                await asyncio.sleep(self.wall(HEARTBEAT_INTERVAL))
+        except websockets.exceptions.WebSocketException:
+            pass
+
+    async def population(self):
+        """Keep about --peers sessions running, replacing each one that ends."""
+        while self.running:
+            while len(self.clients) < self.args.peers:
+                task = asyncio.ensure_future(self.peer_session())
+                self.clients.add(task)
+                task.add_done_callback(self.clients.discard)
+            await asyncio.sleep(self.wall(1))
+
+    async def agent_churn(self, workdir: str):
+        """Launch agents over a control connection and tell older ones to exit."""
+        live: List[str] = []
+
+        async def command_exit(ws, agent_id: str):
+            await ws.send(json.dumps({"type": "agent_command", "agentId": agent_id, "command": {"method": "exit"}}))
+
+        try:
+            async with websockets.connect(self.url) as ws:
+                await ws.send(json.dumps({"type": "presence", "from": "soak-control", "data": {"status": "online"}}))
+                helpers = [asyncio.ensure_future(self.drain_inbound(ws, self.responses)),
+                           asyncio.ensure_future(self.keepalive(ws, "soak-control"))]
+                while self.running:
+                    agent_id = f"soak-agent-{self.next_agent}"
+                    self.next_agent += 1
+                    await ws.send(json.dumps({"type": "launch_agent", "agentId": agent_id,
+                                              "config": {"workingPath": workdir}}))
+                    self.stats["agentsLaunched"] += 1
+                    live.append(agent_id)
+                    while len(live) > self.args.agents:
+                        await command_exit(ws, live.pop(0))
+                    await asyncio.sleep(self.wall(self.args.agent_minutes * 60))
+                for agent_id in live:
+                    await command_exit(ws, agent_id)
+                # The relay stops reading a connection that closes under a reply
+                for _ in live:
+                    await asyncio.wait_for(self.responses.get(), QUIESCE_TIMEOUT)
+                helpers[1].cancel()
+                await ws.close()
+                await helpers[0]
+        except (OSError, asyncio.TimeoutError, websockets.exceptions.WebSocketException):
+            self.stats["errors"] += 1
+
+    async def probe(self) -> List[float]:
+        """Direct-message latency between two dedicated peers, in milliseconds."""
+        samples: List[float] = []
+        async with websockets.connect(self.url) as tx, websockets.connect(self.url) as rx:
+            await tx.send(json.dumps({"type": "presence", "from": "soak-probe-tx", "data": {"status": "online"}}))
+            await rx.send(json.dumps({"type": "presence", "from": "soak-probe-rx", "data": {"status": "online"}}))
+            keepalives = [asyncio.ensure_future(self.keepalive(tx, "soak-probe-tx")),
+                          asyncio.ensure_future(self.keepalive(rx, "soak-probe-rx"))]
+            await asyncio.sleep(core.PRESENCE_COALESCE_WINDOW * 2)
+            try:
+                for n in range(PROBES_PER_SAMPLE):
+                    await tx.send(json.dumps({"type": "direct", "from": "soak-probe-tx", "to": "soak-probe-rx",
+                                              "data": {"probe": n, "sent": time.perf_counter()}}))
+                    while True:
+                        msg = json.loads(await asyncio.wait_for(rx.recv(), 5))
+                        if msg.get("type") == "direct" and msg["data"].get("probe") == n:
+                            samples.append((time.perf_counter() - msg["data"]["sent"]) * 1000)
+                            break
+            except (asyncio.TimeoutError, websockets.exceptions.ConnectionClosed):
+                self.stats["errors"] += 1
+            for keepalive in keepalives:
+                keepalive.cancel()
+            await asyncio.gather(tx.close(), rx.close())
+        return samples
+
+
+def sample(label: str, latencies: List[float]) -> dict:
+    # Closed connections sit in reference cycles until a collection runs
+    gc.collect()
+    heap, _ = tracemalloc.get_traced_memory()
+    return {
+        "at": label,
+        "rssMB": round(rss_bytes() / 2 ** 20, 2),
+        "heapMB": round(heap / 2 ** 20, 2),
+        "fds": open_fds(),
+        "tasks": len(asyncio.all_tasks()),
+        "tables": table_sizes(),
+        "latencyMs": percentiles(latencies),
+    }
+
+
+def print_sample(window: dict):
+    t = window["tables"]
+    print(f"  {window['at']:>8}: rss {window['rssMB']}MB heap {window['heapMB']}MB fds {window['fds']} "
+          f"tasks {window['tasks']} conns {t['connections']} peers {t['peers']} agents {t['agents']} "
+          f"mail {t['mailboxes']} p99 {window['latencyMs'].get('p99')}ms")
+
+
+def top_allocators(before: tracemalloc.Snapshot, after: tracemalloc.Snapshot, limit: int = 10) -> List[str]:
+    """Source lines whose allocations grew the most between two snapshots."""
+    return [str(stat) for stat in after.compare_to(before, "lineno")[:limit] if stat.size_diff > 0]
+
+
+def verdict(baseline: dict, final: dict, windows: List[dict], args: argparse.Namespace) -> List[str]:
+    """Reasons the run failed; empty when the relay returned to its warmed-up footprint."""
+    failures = []
+    checks = [
+        ("rssMB", args.max_rss_growth_mb, "RSS"),
+        ("heapMB", args.max_heap_growth_mb, "traced heap"),
+        ("fds", args.max_fd_growth, "open file descriptors"),
+        ("tasks", args.max_task_growth, "asyncio tasks"),
+    ]
+    for key, limit, name in checks:
+        growth = final[key] - baseline[key]
+        if growth > limit:
+            failures.append(f"{name} grew by {round(growth, 2)} (limit {limit})")
+    for table, size in final["tables"].items():
+        if size > baseline["tables"][table]:
+            failures.append(f"{table} holds {size} entries after quiescing (baseline {baseline['tables'][table]})")
+
+    measured = [w["latencyMs"] for w in windows if w["latencyMs"].get("samples")]
+    if len(measured) >= 2:
+        first, last = measured[0]["p99"], measured[-1]["p99"]
+        if last > max(first, args.latency_floor_ms) * args.max_latency_drift:
+            failures.append(f"p99 latency drifted from {first}ms to {last}ms")
+    return failures
+
+
+async def soak(args: argparse.Namespace) -> dict:
+    scale_timeouts(args.time_scale)
+    core.VALIDATE_EVENTS = False
+    workdir = tempfile.mkdtemp(prefix="ag-mesh-soak-")
+    shim_dir = os.path.join(workdir, "bin")
+    os.mkdir(shim_dir)
+    shim = os.path.join(shim_dir, "kiro-cli")
+    with open(shim, "w") as f:
+        f.write(AGENT_SHIM)
+    os.chmod(shim, 0o755)
+    os.environ["PATH"] = shim_dir + os.pathsep + os.environ.get("PATH", "")
+
+    tracemalloc.start()
+    core.ensure_reaper()
+    agent_reaper = asyncio.ensure_future(server.watch_agents())
+    relay = await websockets.serve(server.handler, "127.0.0.1", 0, max_size=chunking.MAX_FRAME_SIZE,
+                                   process_request=admission.process_request)
+    port = relay.sockets[0].getsockname()[1]
+    run = Soak(f"ws://127.0.0.1:{port}", args)
+
+    samples_total = max(2, int(args.hours * 60 / args.sample_minutes))
+    warmup = max(1, int(samples_total * args.warmup))
+    print(f"Soaking ws://127.0.0.1:{port}: {args.hours}h simulated at {args.time_scale}x "
+          f"({args.hours * 3600 / args.time_scale:.0f}s), {args.peers} peers, {samples_total} samples")
+
+    churn = [asyncio.ensure_future(run.population()), asyncio.ensure_future(run.agent_churn(workdir))]
+    windows = []
+    baseline = baseline_heap = None
+    for n in range(1, samples_total + 1):
+        await asyncio.sleep(run.wall(args.sample_minutes * 60))
+        latencies = await run.probe()
+        window = sample(f"{n * args.sample_minutes / 60:.1f}h", latencies)
+        windows.append(window)
+        print_sample(window)
+
+        if n == warmup:
+            # Measure the baseline with every client gone, the same way as the final sample
+            run.running = False
+            await asyncio.gather(*churn, *list(run.clients), return_exceptions=True)
+            await quiesce()
+            baseline = sample("baseline", [])
+            print_sample(baseline)
+            baseline_heap = tracemalloc.take_snapshot()
+            run.running = True
+            churn = [asyncio.ensure_future(run.population()), asyncio.ensure_future(run.agent_churn(workdir))]
+
+    run.running = False
+    await asyncio.gather(*churn, *list(run.clients), return_exceptions=True)
+    await quiesce()
+    final = sample("final", [])
+    print_sample(final)
+    allocators = top_allocators(baseline_heap, tracemalloc.take_snapshot())
+
+    relay.close()
+    await relay.wait_closed()
+    agent_reaper.cancel()
+    await server.cleanup_agents()
+    tracemalloc.stop()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "baseline": baseline,
+        "final": final,
+        "windows": windows[warmup:],
+        "stats": run.stats,
+        "topAllocators": allocators,
+        "failures": verdict(baseline, final, windows[warmup:], args),
+    }
+
+
+async def quiesce():
+    """Wait until stale peers, exited agents and held mail have had time to be reaped."""
+    # Closing handshakes run on wall-clock timeouts that are not scaled
+    deadline = time.monotonic() + QUIESCE_TIMEOUT
+    while core.connections and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    await asyncio.sleep(max(core.STALE_TIMEOUT, mailbox.MAILBOX_TTL, chunking.UPLOAD_IDLE_TIMEOUT)
+                        + core.REAP_INTERVAL * 2 + core.PRESENCE_COALESCE_WINDOW)
+    await server.reap_agents()
+    await asyncio.sleep(core.PRESENCE_COALESCE_WINDOW * 2)
+
+
+def main():
+    """CLI entry point."""
+    parser = argparse.ArgumentParser(description="Soak the relay under churn and detect leaks and latency drift")
+    parser.add_argument("--hours", type=float, default=4, help="simulated duration")
+    parser.add_argument("--time-scale", type=float, default=240, help="simulated seconds per wall-clock second")
+    parser.add_argument("--peers", type=int, default=20, help="concurrent peer sessions")
+    parser.add_argument("--session-minutes", type=float, default=20, help="mean simulated session length")
+    parser.add_argument("--abandon-ratio", type=float, default=0.2, help="sessions that go silent without closing")
+    parser.add_argument("--rate", type=float, default=1, help="messages per peer per simulated minute")
+    parser.add_argument("--direct-ratio", type=float, default=0.3)
+    parser.add_argument("--agents", type=int, default=4, help="agents kept running at once")
+    parser.add_argument("--agent-minutes", type=float, default=5, help="simulated minutes between agent launches")
+    parser.add_argument("--sample-minutes", type=float, default=30, help="simulated minutes between samples")
+    parser.add_argument("--warmup", type=float, default=0.25, help="fraction of samples before the baseline")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--max-rss-growth-mb", type=float, default=20)
+    parser.add_argument("--max-heap-growth-mb", type=float, default=5)
+    parser.add_argument("--max-fd-growth", type=int, default=4)
+    parser.add_argument("--max-task-growth", type=int, default=2)
+    parser.add_argument("--max-latency-drift", type=float, default=3.0, help="allowed ratio of last to first p99")
+    parser.add_argument("--latency-floor-ms", type=float, default=2.0, help="p99 below this never counts as drift")
+    parser.add_argument("--report", help="write the full report as JSON")
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    report = asyncio.run(soak(args))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+    print(f"Stats after {time.monotonic() - started:.0f}s: {report['stats']}")
+    for line in report["topAllocators"][:5]:
+        print(f"  + {line}")
+    if report["failures"]:
+        for failure in report["failures"]:
+            print(f"LEAK: {failure}")
+        sys.exit(1)
+    print("Soak OK: relay returned to its warmed-up footprint with no latency drift")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Sampled delivery tracing and per-peer RTT probes.
+
+A routed frame (broadcast, stream, direct, ...) is traced when it carries a
+top-level `trace` object, or at random with probability TRACE_SAMPLE_RATE.
+The relay forwards it with its own stamps added (epoch milliseconds):
+
+    trace: {id, relayId, sent?, received, validated}
+
+and records, per recipient, when the frame was enqueued for that peer and
+when it was written to its socket (after any batching). The stages become
+latency histograms in ms:
+
+    client    received - sent (when the sender stamped `sent`)
+    validate  validated - received
+    enqueue   enqueued - validated, per recipient (fan-out order and backpressure)
+    write     written - enqueued, per recipient (batching and socket)
+    relay     written - received, per recipient
+    rtt       relay ping -> peer pong
+
+Peers listing `ping` in their presence `features` get
+{type: 'ping', data: {id, t}} every TRACE_PROBE_INTERVAL seconds and answer
+with a `pong` carrying the same data. Any client may also send `ping`
+itself and gets a `pong` back at once.
+
+`get_latency` returns every histogram, per-peer percentiles and the most
+recent traces.
+"""
+
+import os
+import random
+import time
+import uuid
+from bisect import bisect_left
+from collections import deque
+from typing import Dict, Optional
+
+from .log import RELAY_ID
+
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+# Seconds between RTT probes of `ping` peers (0: no probes)
+TRACE_PROBE_INTERVAL = float(os.getenv("TRACE_PROBE_INTERVAL", "30"))
+# Probes unanswered after this many seconds are counted as lost
+PROBE_TIMEOUT = 10
+# Traces kept for get_latency
+TRACE_RECENT = 100
+# Upper bucket bounds in ms; the last bucket counts everything slower
+BUCKET_BOUNDS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+HOPS = ("client", "validate", "enqueue", "write", "relay", "rtt")
+PEER_HOPS = ("write", "relay", "rtt")
+
+# hop -> histogram
+hops: Dict[str, dict] = {}
+# peer_id -> hop -> histogram
+peer_hops: Dict[str, Dict[str, dict]] = {}
+# most recent traces, each {id, type, from, sent?, received, validated, peers: {pid: {enqueued, written}}}
+recent: deque = deque(maxlen=TRACE_RECENT)
+# (peer_id, probe id) -> monotonic send time
+probes: Dict[tuple, float] = {}
+# next probe id
+_state: dict = {"probe": 0}
+stats = {"traced": 0, "probes": 0, "probesLost": 0}
+
+
+def now_ms() -> float:
+    return round(time.time() * 1000, 3)
+
+
+def histogram() -> dict:
+    return {"counts": [0] * (len(BUCKET_BOUNDS) + 1), "count": 0, "sum": 0.0, "max": 0.0}
+
+
+def observe(hop: str, ms: float, peer_id: Optional[str] = None):
+    ms = max(0.0, ms)
+    targets = [hops.setdefault(hop, histogram())]
+    if peer_id is not None and hop in PEER_HOPS:
+        targets.append(peer_hops.setdefault(peer_id, {}).setdefault(hop, histogram()))
+    bucket = bisect_left(BUCKET_BOUNDS, ms)
+    for h in targets:
+        h["counts"][bucket] += 1
+        h["count"] += 1
+        h["sum"] += ms
+        h["max"] = max(h["max"], ms)
+
+
+def percentile(h: dict, q: float) -> Optional[float]:
+    """Upper bound of the bucket holding the q-th sample (max for the overflow bucket)."""
+    if not h["count"]:
+        return None
+    rank = q * h["count"]
+    seen = 0
+    for bound, count in zip(BUCKET_BOUNDS, h["counts"]):
+        seen += count
+        if seen >= rank:
+            return round(min(bound, h["max"]), 3)
+    return round(h["max"], 3)
+
+
+def summarize(h: dict) -> dict:
+    return {
+        "count": h["count"],
+        "mean": round(h["sum"] / h["count"], 3) if h["count"] else None,
+        "p50": percentile(h, 0.5),
+        "p90": percentile(h, 0.9),
+        "p99": percentile(h, 0.99),
+        "max": round(h["max"], 3),
+    }
+
+
+def begin(msg: dict, received: float) -> Optional[dict]:
+    """Start a trace for an inbound routed frame if it asked for one or is sampled."""
+    requested = msg.get("trace")
+    if requested is None and (not TRACE_SAMPLE_RATE or random.random() >= TRACE_SAMPLE_RATE):
+        return None
+    if not isinstance(requested, dict):
+        requested = {}
+    record = {
+        "id": str(requested.get("id") or uuid.uuid4()),
+        "type": msg.get("type"),
+        "from": msg.get("from"),
+        "received": received,
+        "validated": None,
+        "peers": {},
+    }
+    sent = requested.get("sent")
+    if isinstance(sent, (int, float)):
+        record["sent"] = sent
+        observe("client", received - sent)
+    recent.append(record)
+    stats["traced"] += 1
+    return record
+
+
+def stamp(msg: dict, record: dict) -> dict:
+    """Mark the frame validated and return it with the relay's stamps for forwarding."""
+    record["validated"] = now_ms()
+    observe("validate", record["validated"] - record["received"])
+    requested = msg.get("trace") if isinstance(msg.get("trace"), dict) else {}
+    return {**msg, "trace": {**requested, "id": record["id"], "relayId": RELAY_ID,
+                             "received": record["received"], "validated": record["validated"]}}
+
+
+def enqueued(record: dict, peer_id: Optional[str]):
+    t = now_ms()
+    record["peers"][peer_id] = {"enqueued": t, "written": None}
+    observe("enqueue", t - (record["validated"] or record["received"]), peer_id)
+
+
+def written(record: dict, peer_id: Optional[str]):
+    t = now_ms()
+    hop = record["peers"].setdefault(peer_id, {"enqueued": t, "written": None})
+    hop["written"] = t
+    observe("write", t - hop["enqueued"], peer_id)
+    observe("relay", t - record["received"], peer_id)
+
+
+def probe_frame(peer_id: str) -> dict:
+    """A ping for one peer, remembered until its pong arrives or it times out."""
+    _state["probe"] += 1
+    probes[(peer_id, _state["probe"])] = time.monotonic()
+    stats["probes"] += 1
+    return {"type": "ping", "data": {"id": _state["probe"], "t": now_ms()}}
+
+
+def pong(peer_id: Optional[str], data: dict):
+    """Record the RTT of an answered probe."""
+    sent = probes.pop((peer_id, data.get("id")), None)
+    if sent is not None:
+        observe("rtt", (time.monotonic() - sent) * 1000, peer_id)
+
+
+def expire_probes():
+    cutoff = time.monotonic() - PROBE_TIMEOUT
+    for key in [key for key, sent in probes.items() if sent < cutoff]:
+        del probes[key]
+        stats["probesLost"] += 1
+
+
+def forget_peer(peer_id: str):
+    peer_hops.pop(peer_id, None)
+    for key in [key for key in probes if key[0] == peer_id]:
+        del probes[key]
+
+
+def hop_summary() -> dict:
+    """Percentiles per hop, for status surfaces."""
+    return {hop: summarize(hops[hop]) for hop in HOPS if hop in hops}
+
+
+def snapshot() -> dict:
+    """Everything get_latency returns."""
+    return {
+        "relayId": RELAY_ID,
+        "sampleRate": TRACE_SAMPLE_RATE,
+        "bounds": list(BUCKET_BOUNDS),
+        "hops": {hop: {**summarize(h), "counts": list(h["counts"])} for hop, h in hops.items()},
+        "peers": {
+            peer_id: {hop: summarize(h) for hop, h in peer.items()}
+            for peer_id, peer in peer_hops.items()
+        },
+        "recent": list(recent),
+        "stats": dict(stats),
+    }
+
+
+def clear():
+    hops.clear()
+    peer_hops.clear()
+    recent.clear()
+    probes.clear()